@@ -1,35 +1,110 @@
 import logging
+import threading
+import weakref
 
 db_default_formatter = logging.Formatter()
 
+# All DatabaseLogHandlers in this process, so they can be flushed by flush_database_logs()
+_handlers = weakref.WeakSet()
+
+
+def flush_database_logs():
+    """
+    Write all buffered log records to the database. Called at the end of each policy evaluation.
+    """
+    for handler in list(_handlers):
+        handler.flush()
+
 
 class DatabaseLogHandler(logging.Handler):
+    """
+    Logging handler that stores records as EvaluationLogs.
+
+    Records are buffered in memory (per thread) and written with a single bulk insert when ``flush`` is called,
+    when ``capacity`` records have been buffered, and when the handler is closed at shutdown.
+    """
+
+    def __init__(self, capacity=100, level=logging.NOTSET):
+        super().__init__(level)
+        self.capacity = capacity
+        self._local = threading.local()
+        _handlers.add(self)
+
+    @property
+    def _buffer(self):
+        if not hasattr(self._local, "buffer"):
+            self._local.buffer = []
+            # Stringified policy and action for each proposal, so they're computed once per flush
+            self._local.proposal_strs = {}
+        return self._local.buffer
+
     def emit(self, record):
         from .models import EvaluationLog
 
-        trace = None
+        try:
+            trace = None
 
-        if record.exc_info:
-            trace = db_default_formatter.formatException(record.exc_info)
+            if record.exc_info:
+                trace = db_default_formatter.formatException(record.exc_info)
 
-        msg = self.format(record)
+            msg = self.format(record)
+
+            community = record.community
+            proposal = record.proposal
+
+            buffer = self._buffer
+            proposal_strs = self._local.proposal_strs
+            if proposal.pk not in proposal_strs:
+                proposal_strs[proposal.pk] = (str(proposal.policy), str(proposal.action))
+            policy_str, action_str = proposal_strs[proposal.pk]
+
+            buffer.append(
+                EvaluationLog(
+                    logger_name=record.name,
+                    level=record.levelno,
+                    msg=msg,
+                    trace=trace,
+                    community=community,
+                    proposal=proposal,
+                    # Include stringified versions of action and policy so they remain if when the eval is deleted
+                    policy_str=policy_str,
+                    action_str=action_str,
+                )
+            )
+        except Exception:
+            self.handleError(record)
+            return
+
+        if len(buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        from django.db import transaction
+
+        from .models import EvaluationLog
 
-        community = record.community
-        proposal = record.proposal
+        buffer = getattr(self._local, "buffer", None)
+        if not buffer:
+            return
 
-        kwargs = {
-            "logger_name": record.name,
-            "level": record.levelno,
-            "msg": msg,
-            "trace": trace,
-            "community": community,
-            "proposal": proposal,
-            # Include stringified versions of action and policy so they remain if when the eval is deleted
-            "policy_str": str(proposal.policy),
-            "action_str": str(proposal.action)
-        }
+        self.acquire()
+        try:
+            self._local.buffer = []
+            self._local.proposal_strs = {}
+            # In a savepoint, so a failed insert doesn't abort a transaction that the caller is in
+            with transaction.atomic():
+                EvaluationLog.objects.bulk_create(buffer)
+        except Exception:
+            # Don't let a failed insert break the evaluation that is logging
+            logging.getLogger(__name__).exception(f"Failed to write {len(buffer)} evaluation logs")
+        finally:
+            self.release()
 
-        EvaluationLog.objects.create(**kwargs)
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            super().close()
 
     def format(self, record):
         if self.formatter:
@@ -47,4 +122,4 @@ class DatabaseLogHandler(logging.Handler):
 
             return fmt.formatMessage(record)
         else:
-            return fmt.format(record)
\ No newline at end of file
+            return fmt.format(record)
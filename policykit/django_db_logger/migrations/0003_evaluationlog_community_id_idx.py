@@ -0,0 +1,17 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_db_logger', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evaluationlog',
+            index=models.Index(fields=['community', 'id'], name='evaluationlog_community_id_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 import logging
 from django.db import models
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 from six import python_2_unicode_compatible
 from django.utils.translation import gettext_lazy as _
 from policyengine.models import Community, Proposal
@@ -33,6 +35,10 @@ class EvaluationLog(models.Model):
     class Meta:
         ordering = ("-create_datetime",)
         verbose_name_plural = verbose_name = "Logging"
+        indexes = [
+            # Used to find each community's retention watermark in clean_up_logs
+            models.Index(fields=["community", "id"], name="evaluationlog_community_id_idx"),
+        ]
 
     def action(self):
         if self.proposal and self.proposal.action:
@@ -42,4 +48,12 @@ class EvaluationLog(models.Model):
     def policy(self):
         if self.proposal and self.proposal.policy:
             return self.proposal.policy
-        return self.policy_str
\ No newline at end of file
+        return self.policy_str
+
+
+@receiver(pre_delete, sender=Proposal)
+def flush_logs_before_proposal_delete(sender, instance, **kwargs):
+    # Buffered logs reference the proposal, so write them before it goes away
+    from django_db_logger.db_log_handler import flush_database_logs
+
+    flush_database_logs()
@@ -4,17 +4,14 @@ from django.dispatch import receiver
 from integrations.discord.models import (
     DiscordCommunity,
     DiscordSlashCommand,
+    DiscordUser,
     DISCORD_SLASH_COMMAND_NAME,
     DISCORD_SLASH_COMMAND_OPTION,
 )
 from metagov.core.signals import governance_process_updated, platform_event_created
 from metagov.plugins.discord.models import Discord, DiscordVote
-from policyengine.models import (
-    BooleanVote,
-    NumberVote,
-    Proposal,
-    ChoiceVote,
-)
+from policyengine.models import Proposal
+from policyengine.tasks import schedule_proposal_reevaluation
 
 logger = logging.getLogger(__name__)
 
@@ -133,30 +130,16 @@ def discord_vote_updated_receiver(sender, instance, status, outcome, errors, **k
     votes = outcome["votes"]
     is_boolean_vote = set(votes.keys()) == {"yes", "no"}
 
-    ### 1) Count boolean vote
     if is_boolean_vote:
-        for (vote_option, result) in votes.items():
-            boolean_value = True if vote_option == "yes" else False
-            for u in result["users"]:
-                user, _ = discord_community._get_or_create_user(user_id=u)
-                existing_vote = BooleanVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user}")
-                    BooleanVote.objects.create(proposal=proposal, user=user, boolean_value=boolean_value)
-                elif existing_vote.boolean_value != boolean_value:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user} (vote changed)")
-                    existing_vote.boolean_value = boolean_value
-                    existing_vote.save()
-    ### 2) Count choice vote
+        user_votes = {vote_option == "yes": result["users"] for (vote_option, result) in votes.items()}
     else:
-        for (vote_option, result) in votes.items():
-            for u in result["users"]:
-                user, _ = discord_community._get_or_create_user(user_id=u)
-                existing_vote = ChoiceVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal}")
-                    ChoiceVote.objects.create(proposal=proposal, user=user, value=vote_option)
-                elif existing_vote.value != vote_option:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal} (vote changed)")
-                    existing_vote.value = vote_option
-                    existing_vote.save()
+        user_votes = {vote_option: result["users"] for (vote_option, result) in votes.items()}
+    votes_changed = proposal.sync_votes(
+        user_votes,
+        discord_community,
+        DiscordUser,
+        user_fields=lambda u: {"username": f"{u}:{discord_community.team_id}"},
+    )
+
+    if votes_changed:
+        schedule_proposal_reevaluation(proposal)
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discourse', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discoursecommunity',
+            name='last_topic_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='discoursecommunity',
+            name='latest_etag',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
@@ -14,6 +14,12 @@ class DiscourseCommunity(CommunityPlatform):
     team_id = models.CharField('team_id', max_length=150, unique=True)
     api_key = models.CharField('api_key', max_length=100, unique=True)
 
+    last_topic_id = models.IntegerField(null=True, blank=True)
+    """Highest topic id seen by the listener. Topics with higher ids are new. Empty until the first poll."""
+
+    latest_etag = models.CharField(max_length=200, blank=True)
+    """ETag of the last topic list fetched by the listener, so unchanged lists aren't processed again."""
+
     def initiate_vote(self, proposal, users=None, text=None, topic_id=None):
         from integrations.discourse.views import initiate_action_vote
         initiate_action_vote(proposal, users, text, topic_id)
@@ -4,20 +4,79 @@ from celery import shared_task
 from django.conf import settings
 from policyengine.models import Proposal, GovernableAction, BooleanVote
 from integrations.discourse.models import DiscourseCommunity, DiscourseUser, DiscourseCreateTopic
-import urllib.request
-import urllib.error
-import json
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import logging
-import json
+import threading
 
-logger = logging.getLogger(__name__)
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def should_create_action(community, call_type, topic, username):
-    # If topic already has an object, don't create a new object for it.
-    if DiscourseCreateTopic.objects.filter(topic_id=topic['id']).exists():
-        return False
+logger = logging.getLogger(__name__)
 
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Returns the requests Session used for polling Discourse. Connections are pooled (and kept alive) per host,
+    and failed requests are retried with exponential backoff.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(
+                total=settings.DISCOURSE_HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+            )
+            adapter = HTTPAdapter(
+                pool_connections=settings.DISCOURSE_LISTENER_CONCURRENCY,
+                pool_maxsize=settings.DISCOURSE_LISTENER_CONCURRENCY,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+    return _http_session
+
+
+def get_response(community, path, etag=None):
+    headers = {"User-Api-Key": community.api_key}
+    if etag:
+        headers["If-None-Match"] = etag
+    resp = get_http_session().get(community.team_id + path, headers=headers, timeout=settings.DISCOURSE_HTTP_TIMEOUT)
+    resp.raise_for_status()
+    # Parse here, so a body that isn't JSON counts as a failed request
+    resp.data = resp.json() if resp.status_code != 304 else None
+    return resp
+
+
+def get_responses_concurrently(requests_to_make):
+    """
+    Makes GET requests for a list of (community, path, etag) tuples, at most DISCOURSE_LISTENER_CONCURRENCY at a time.
+    Returns the responses in the same order, with None for requests that failed, so one unreachable
+    forum doesn't stop the others from being processed. When an etag is given, the response may be a 304.
+    Each response's parsed JSON body is in ``resp.data``.
+    """
+    def fetch(request):
+        community, path, etag = request
+        try:
+            return get_response(community, path, etag)
+        except (requests.RequestException, ValueError):
+            logger.exception(f"Failed to fetch {path} from {community.team_id}")
+            return None
+
+    if not requests_to_make:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(requests_to_make), settings.DISCOURSE_LISTENER_CONCURRENCY)) as executor:
+        return list(executor.map(fetch, requests_to_make))
+
+
+def is_recent_topic(topic):
     created_at = topic['created_at']
     created_at = created_at.replace("Z", "+00:00")
     created_at = datetime.datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S.%f+00:00")
@@ -28,98 +87,168 @@ def should_create_action(community, call_type, topic, username):
     # don't create an object for it. This way, we only create objects for
     # topics created after PolicyKit has been installed to the community.
     recent_time = 2 * settings.CELERY_BEAT_FREQUENCY
-    if now - created_at > datetime.timedelta(seconds=recent_time):
-        return False
-
-    return True
+    return now - created_at <= datetime.timedelta(seconds=recent_time)
+
+
+def find_new_topics(community, topic_list):
+    """
+    Returns the topics from a /latest.json response that don't have a DiscourseCreateTopic yet,
+    with the username of each topic's author.
+
+    Topics with ids above the community's ``last_topic_id`` are new. On the first poll there's no cursor,
+    so only topics created in the last two beat intervals are picked up.
+    """
+    topics = topic_list['topic_list']['topics']
+    usernames = {u['id']: u['username'] for u in topic_list['users']}
+
+    if community.last_topic_id is None:
+        candidates = [topic for topic in topics if is_recent_topic(topic)]
+    else:
+        candidates = [topic for topic in topics if topic['id'] > community.last_topic_id]
+
+    known_topic_ids = set(
+        DiscourseCreateTopic.objects.filter(
+            community=community, topic_id__in=[topic['id'] for topic in candidates]
+        ).values_list('topic_id', flat=True)
+    )
+
+    new_topics = []
+    for topic in candidates:
+        if topic['id'] in known_topic_ids:
+            continue
+        user_id = topic['posters'][0]['user_id']
+        username = usernames.get(user_id)
+        if not username:
+            logger.error(f"no username found for user id {user_id}, skipping topic")
+            continue
+        new_topics.append((topic, username))
+    return new_topics
 
 @shared_task
 def discourse_listener_actions():
-    for community in DiscourseCommunity.objects.all():
-        actions = []
-
-        url = community.team_id
-        api_key = community.api_key
-
-        req = urllib.request.Request(url + '/latest.json')
-        req.add_header("User-Api-Key", api_key)
-        resp = urllib.request.urlopen(req)
-        logger.info(f"topics response: {resp.status} {resp.reason}")
-        res = json.loads(resp.read().decode('utf-8'))
-        topics = res['topic_list']['topics']
-        users = res['users']
-        logger.info(f"{len(topics)} topics")
-        for topic in topics:
-            user_id = topic['posters'][0]['user_id']
-            usernames = [u['username'] for u in users if u['id'] == user_id]
-            if not usernames:
-                logger.error(f"no username found for user id {user_id}, skipping topic")
-                continue
-            username = usernames[0]
-            call_type = '/posts.json'
-            if should_create_action(community, call_type, topic, username):
-                logger.info(f"creating new DiscourseCreateTopic object for topic {topic['title']}")
-
-                # Retrieve raw from first post under topic (created when topic created)
-                req = urllib.request.Request(f"{url}/t/{str(topic['id'])}/posts.json?include_raw=True")
-                req.add_header("User-Api-Key", api_key)
-                resp = urllib.request.urlopen(req)
-                logger.info(f"raw post response: {resp.status} {resp.reason}")
-                res = json.loads(resp.read().decode('utf-8'))
-                raw = res['post_stream']['posts'][0]['raw']
-
-                new_api_action = DiscourseCreateTopic()
-                new_api_action.community = community
-                new_api_action.title = topic['title']
-                new_api_action.category = topic['category_id']
-                new_api_action.raw = raw
-                new_api_action.topic_id = topic['id']
-
-                u,_ = DiscourseUser.objects.get_or_create(
-                    username=username,
-                    community=community
-                )
-                new_api_action.initiator = u
-                actions.append(new_api_action)
-        logger.info(f"{len(actions)} actions created")
-        for action in actions:
-            action.community_origin = True
-            action.save()
-            if action.community_revert:
-                action._revert()
-
-        # Manage proposals
-        pending_proposals = Proposal.objects.filter(
-            status=Proposal.PROPOSED,
-            action__community=community,
-            vote_post_id__isnull=False
+    # Requests are made concurrently for all communities, and database changes are made on this thread
+    communities = list(DiscourseCommunity.objects.all())
+
+    # 1) Find new topics. Topic lists that haven't changed since the last poll (HTTP 304) are skipped.
+    new_topics = []
+    topic_lists = get_responses_concurrently(
+        [(community, '/latest.json', community.latest_etag) for community in communities]
+    )
+    latest_topic_ids = {}
+    for community, resp in zip(communities, topic_lists):
+        if resp is None or resp.status_code == 304:
+            continue
+        topic_list = resp.data
+        topic_ids = [topic['id'] for topic in topic_list['topic_list']['topics']]
+        latest_topic_ids[community.pk] = max(topic_ids + [community.last_topic_id or 0])
+        community.latest_etag = resp.headers.get('ETag', '')[:200]
+        for topic, username in find_new_topics(community, topic_list):
+            new_topics.append((community, topic, username))
+    logger.info(f"{len(new_topics)} new topics")
+
+    # 2) Retrieve raw from first post under each new topic (created when topic created), and create actions
+    posts = get_responses_concurrently(
+        [(community, f"/t/{str(topic['id'])}/posts.json?include_raw=True", None) for (community, topic, _) in new_topics]
+    )
+    topics_by_community = {}
+    for (community, topic, username), resp in zip(new_topics, posts):
+        topics_by_community.setdefault(community.pk, []).append((topic, username, resp))
+    # Each community is processed on its own, so one that fails doesn't hold up the cursors of the others
+    for community in communities:
+        if community.pk not in latest_topic_ids:
+            continue
+        try:
+            create_topic_actions(community, topics_by_community.get(community.pk, []), latest_topic_ids[community.pk])
+        except Exception:
+            logger.exception(f"Failed to create actions for the new topics of {community.team_id}")
+
+    # 3) Manage proposals
+    pending_proposals = []
+    for community in communities:
+        pending_proposals.extend(
+            (community, proposal)
+            for proposal in Proposal.objects.filter(
+                status=Proposal.PROPOSED,
+                action__community=community,
+                vote_post_id__isnull=False
+            ).exclude(vote_post_id='')
+        )
+    vote_posts = get_responses_concurrently(
+        [(community, '/posts/' + proposal.vote_post_id + '.json', None) for (community, proposal) in pending_proposals]
+    )
+    for (community, proposal), resp in zip(pending_proposals, vote_posts):
+        if resp is None:
+            continue
+        try:
+            update_votes(community, proposal, resp.data['polls'][0])
+        except Exception:
+            logger.exception(f"Failed to update the votes of proposal {proposal.pk} from {community.team_id}")
+
+
+def create_topic_actions(community, new_topics, latest_topic_id):
+    """
+    Creates a DiscourseCreateTopic for each new topic of the community, from (topic, username, response) tuples
+    where the response has the topic's posts. Then advances the community's cursor to ``latest_topic_id``,
+    and stores its ETag. Topics whose posts couldn't be fetched are retried on the next poll.
+    """
+    actions = []
+    for topic, username, resp in new_topics:
+        if resp is None:
+            # Retry this topic on the next poll
+            latest_topic_id = min(latest_topic_id, topic['id'] - 1)
+            community.latest_etag = ''
+            continue
+        logger.info(f"creating new DiscourseCreateTopic object for topic {topic['title']}")
+        raw = resp.data['post_stream']['posts'][0]['raw']
+
+        new_api_action = DiscourseCreateTopic()
+        new_api_action.community = community
+        new_api_action.title = topic['title']
+        new_api_action.category = topic['category_id']
+        new_api_action.raw = raw
+        new_api_action.topic_id = topic['id']
+
+        u,_ = DiscourseUser.objects.get_or_create(
+            username=username,
+            community=community
         )
-        for proposal in pending_proposals:
-            id = proposal.vote_post_id
-
-            req = urllib.request.Request(url + '/posts/' + id + '.json')
-            req.add_header("User-Api-Key", api_key)
-            resp = urllib.request.urlopen(req)
-            res = json.loads(resp.read().decode('utf-8'))
-            poll = res['polls'][0]
-
-            # Manage Boolean voting
-            for option in poll['options']:
-                val = (option['html'] == 'Yes')
-
-                for user in poll['preloaded_voters'][option['id']]:
-                    u = DiscourseUser.objects.filter(
-                        username=user['id'],
-                        community=community
-                    )
-                    if u.exists():
-                        u = u[0]
-
-                        bool_vote = BooleanVote.objects.filter(proposal=proposal, user=u)
-                        if bool_vote.exists():
-                            vote = bool_vote[0]
-                            if vote.boolean_value != val:
-                                vote.boolean_value = val
-                                vote.save()
-                        else:
-                            b = BooleanVote.objects.create(proposal=proposal, user=u, boolean_value=val)
+        new_api_action.initiator = u
+        actions.append(new_api_action)
+    logger.info(f"{len(actions)} actions created for {community.team_id}")
+    for action in actions:
+        action.community_origin = True
+        action.save()
+        if action.community_revert:
+            action._revert()
+
+    # Advance the cursor once the new topics are stored
+    community.last_topic_id = latest_topic_id
+    DiscourseCommunity.objects.filter(pk=community.pk).update(
+        last_topic_id=latest_topic_id, latest_etag=community.latest_etag
+    )
+
+
+def update_votes(community, proposal, poll):
+    """
+    Saves the votes of a Discourse poll on the proposal's vote post as BooleanVotes.
+    """
+    # Manage Boolean voting
+    for option in poll['options']:
+        val = (option['html'] == 'Yes')
+
+        for user in poll['preloaded_voters'][option['id']]:
+            u = DiscourseUser.objects.filter(
+                username=user['id'],
+                community=community
+            )
+            if u.exists():
+                u = u[0]
+
+                bool_vote = BooleanVote.objects.filter(proposal=proposal, user=u)
+                if bool_vote.exists():
+                    vote = bool_vote[0]
+                    if vote.boolean_value != val:
+                        vote.boolean_value = val
+                        vote.save()
+                else:
+                    b = BooleanVote.objects.create(proposal=proposal, user=u, boolean_value=val)
@@ -4,7 +4,8 @@ from django.dispatch import receiver
 from integrations.github.models import GithubCommunity, GithubUser
 from metagov.core.signals import governance_process_updated, platform_event_created
 from metagov.plugins.github.models import Github, GithubIssueReactVote
-from policyengine.models import BooleanVote, Proposal
+from policyengine.models import Proposal
+from policyengine.tasks import schedule_proposal_reevaluation
 
 logger = logging.getLogger(__name__)
 
@@ -42,16 +43,11 @@ def github_vote_updated_receiver(sender, instance, status, outcome, errors, **kw
     votes = outcome["votes"]
 
     # Expect this process to be a boolean vote
-    for (k, v) in votes.items():
-        assert k == "yes" or k == "no"
-        reaction_bool = True if k == "yes" else False
-        for u in v["users"]:
-            user, _ = GithubUser.objects.get_or_create(username=u, readable_name=u, community=github_community)
-            existing_vote = BooleanVote.objects.filter(proposal=proposal, user=user).first()
-            if existing_vote is None:
-                logger.debug(f"Casting boolean vote {reaction_bool} by {user} for {proposal.action}")
-                BooleanVote.objects.create(proposal=proposal, user=user, boolean_value=reaction_bool)
-            elif existing_vote.boolean_value != reaction_bool:
-                logger.debug(f"Casting boolean vote {reaction_bool} by {user} for {proposal.action} (vote changed)")
-                existing_vote.boolean_value = reaction_bool
-                existing_vote.save()
+    assert set(votes.keys()) <= {"yes", "no"}
+    user_votes = {k == "yes": v["users"] for (k, v) in votes.items()}
+    votes_changed = proposal.sync_votes(
+        user_votes, github_community, GithubUser, user_fields=lambda u: {"username": u, "readable_name": u}
+    )
+
+    if votes_changed:
+        schedule_proposal_reevaluation(proposal)
@@ -4,7 +4,8 @@ from django.dispatch import receiver
 from integrations.loomio.models import LoomioCommunity, LoomioUser
 from metagov.core.signals import governance_process_updated
 from metagov.plugins.loomio.models import LoomioPoll
-from policyengine.models import ChoiceVote, Proposal
+from policyengine.models import Proposal
+from policyengine.tasks import schedule_proposal_reevaluation
 
 logger = logging.getLogger(__name__)
 
@@ -34,15 +35,10 @@ def loomio_vote_updated_receiver(sender, instance, status, outcome, errors, **kw
         return
 
     votes = outcome["votes"]
+    user_votes = {vote_option: result["users"] for (vote_option, result) in votes.items()}
+    votes_changed = proposal.sync_votes(
+        user_votes, loomio_community, LoomioUser, user_fields=lambda u: {"username": u, "readable_name": u}
+    )
 
-    for (vote_option, result) in votes.items():
-        for u in result["users"]:
-            user, _ = LoomioUser.objects.get_or_create(username=u, readable_name=u, community=loomio_community)
-            existing_vote = ChoiceVote.objects.filter(proposal=proposal, user=user).first()
-            if existing_vote is None:
-                logger.debug(f"Casting vote for {vote_option} by {user} for proposal {proposal}")
-                ChoiceVote.objects.create(proposal=proposal, user=user, value=vote_option)
-            elif existing_vote.value != vote_option:
-                logger.debug(f"Casting vote for {vote_option} by {user} for proposal {proposal} (vote changed)")
-                existing_vote.value = vote_option
-                existing_vote.save()
+    if votes_changed:
+        schedule_proposal_reevaluation(proposal)
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reddit', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='redditcommunity',
+            name='vote_post_comment_counts',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
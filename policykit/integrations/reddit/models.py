@@ -37,6 +37,8 @@ class RedditCommunity(CommunityPlatform):
     team_id = models.CharField('team_id', max_length=150, unique=True)
     access_token = models.CharField('access_token', max_length=300, unique=True)
     refresh_token = models.CharField('refresh_token', max_length=500, null=True)
+    vote_post_comment_counts = models.JSONField(default=dict, blank=True)
+    """Number of comments on each pending vote post at the last poll, by post name. Used to skip posts without new comments."""
 
     def make_call(self, url, values=None, action=None, method=None):
         logger.info(self.API + url)
@@ -2,31 +2,32 @@
 from __future__ import absolute_import, unicode_literals
 
 from celery import shared_task
-from policyengine.models import Proposal, LogAPICall, Proposal, BooleanVote
-from integrations.reddit.models import RedditCommunity, RedditUser, RedditMakePost
-import datetime
+from django.conf import settings
+from policyengine.models import Proposal, LogAPICall
+from policyengine.tasks import schedule_proposal_reevaluation
+from integrations.reddit.models import REDDIT_USER_AGENT, RedditCommunity, RedditUser, RedditMakePost
+from concurrent.futures import ThreadPoolExecutor
 import logging
-import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+_http_session = None
+_http_session_lock = threading.Lock()
+
 def is_policykit_action(community, name, call_type, test_a, test_b):
     vote_post_id = Proposal.objects.filter(vote_post_id=name, action__community=community)
     if vote_post_id.exists():
         logger.info('approve PolicyKit post')
         community.make_call('api/approve', {'id': name})
         return True
-    else:
-        current_time_minus = datetime.datetime.now() - datetime.timedelta(minutes=2)
-        logs = LogAPICall.objects.filter(proposal_time__gte=current_time_minus,
-                                                call_type=call_type)
-        if logs.exists():
-            logger.info("checking API logging")
-            for log in logs:
-                j_info = json.loads(log.extra_info)
-                if test_a == j_info[test_b]:
-                    logger.info("checking API logging FOUND")
-                    return True
+    elif LogAPICall.is_recent_call(community, call_type, test_b, test_a, seconds=120):
+        logger.info("checking API logging FOUND")
+        return True
     return False
 
 @shared_task
@@ -65,47 +66,137 @@ def reddit_listener_actions():
             action.save() # save triggers policy proposal
 
         # Manage proposals
-        pending_proposals = Proposal.objects.filter(
-            status=Proposal.PROPOSED,
-            action__community=community,
-            vote_post_id__isnull=False
+        update_votes(community)
+
+
+def get_http_session():
+    """
+    Returns the requests Session used for polling Reddit. Connections are pooled (and kept alive),
+    and failed requests are retried with exponential backoff.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+            adapter = HTTPAdapter(
+                pool_maxsize=settings.REDDIT_LISTENER_CONCURRENCY,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            _http_session = session
+    return _http_session
+
+
+class RedditTokenExpired(Exception):
+    """Raised by get_json when Reddit rejects the community's access token"""
+    pass
+
+
+def get_json(community, path):
+    """
+    GET a Reddit API path with the community's token, or None if the request failed.
+    Raises RedditTokenExpired if the token was rejected, see ``get_json_refreshing_token``.
+    Safe to call from worker threads, because it doesn't touch the database.
+    """
+    try:
+        resp = get_http_session().get(
+            community.API + path,
+            headers={"Authorization": "bearer %s" % community.access_token, "User-Agent": REDDIT_USER_AGENT},
+            timeout=settings.REDDIT_HTTP_TIMEOUT,
         )
-        for proposal in pending_proposals:
-            id = proposal.vote_post_id.split('_')[1]
-
-            call = 'r/policykit/comments/' + id + '.json'
-            res = community.make_call(call)
-            replies = res[1]['data']['children']
-
-            for reply in replies:
-                data = reply['data']
-
-                text = data['body']
-
-                logger.info(text)
-
-                val = None
-                if '\\-1' in text:
-                    val = False
-                elif '\\+1' in text:
-                    val = True
-
-                if val != None:
-                    username = data['author']
-                    u = RedditUser.objects.filter(username=username,
-                                                  community=community)
-
-                    if u.exists():
-                        u = u[0]
-                        bool_vote = BooleanVote.objects.filter(proposal=proposal,
-                                                               user=u)
-                        if bool_vote.exists():
-                            vote = bool_vote[0]
-                            if vote.boolean_value != val:
-                                vote.boolean_value = val
-                                vote.save()
-                        else:
-                            b = BooleanVote.objects.create(proposal=proposal,
-                                                           user=u,
-                                                           boolean_value=val)
-                            logger.info('created vote')
+        if resp.status_code == 401:
+            raise RedditTokenExpired
+        resp.raise_for_status()
+        return resp.json()
+    except (requests.RequestException, ValueError):
+        logger.exception(f"Failed to fetch {path}")
+        return None
+
+
+def get_json_refreshing_token(community, path):
+    """
+    Like get_json, but if the access token was rejected, refreshes it once and retries, like
+    RedditCommunity.make_call does. Only call this from the main thread, because refreshing saves the community.
+    """
+    try:
+        return get_json(community, path)
+    except RedditTokenExpired:
+        logger.info("Reddit access token expired, refreshing")
+        community.refresh_access_token()
+    try:
+        return get_json(community, path)
+    except RedditTokenExpired:
+        logger.error(f"Reddit rejected the refreshed access token for {path}")
+        return None
+
+
+def update_votes(community):
+    """
+    Counts votes from the comments on the vote posts of the community's pending proposals.
+
+    The comment counts of all vote posts are fetched in batches of 100 with api/info. Only posts whose count
+    changed since the last poll have their comments fetched, concurrently. Votes are saved with Proposal.sync_votes.
+    """
+    pending_proposals = list(Proposal.objects.filter(
+        status=Proposal.PROPOSED,
+        action__community=community,
+        vote_post_id__isnull=False
+    ).exclude(vote_post_id=''))
+
+    post_names = [proposal.vote_post_id for proposal in pending_proposals]
+    comment_counts = {}
+    for i in range(0, len(post_names), 100):
+        # On the main thread, so an expired token is refreshed before the comments are fetched
+        res = get_json_refreshing_token(community, 'api/info?id=' + ','.join(post_names[i:i + 100]))
+        if res:
+            for child in res['data']['children']:
+                comment_counts[child['data']['name']] = child['data']['num_comments']
+
+    previous_counts = community.vote_post_comment_counts
+    changed_proposals = [
+        proposal for proposal in pending_proposals
+        if proposal.vote_post_id not in comment_counts
+        or previous_counts.get(proposal.vote_post_id) != comment_counts[proposal.vote_post_id]
+    ]
+
+    def get_comments(proposal):
+        id = proposal.vote_post_id.split('_')[1]
+        try:
+            return get_json(community, 'r/policykit/comments/' + id + '.json')
+        except RedditTokenExpired:
+            return None
+
+    with ThreadPoolExecutor(max_workers=settings.REDDIT_LISTENER_CONCURRENCY) as executor:
+        comment_trees = list(executor.map(get_comments, changed_proposals))
+
+    new_counts = dict(comment_counts)
+    for proposal, res in zip(changed_proposals, comment_trees):
+        if res is None:
+            # Try again on the next poll
+            new_counts.pop(proposal.vote_post_id, None)
+            continue
+
+        # Each author's last vote counts
+        vote_by_author = {}
+        for reply in res[1]['data']['children']:
+            data = reply['data']
+            text = data.get('body', '')
+
+            if '\\-1' in text:
+                vote_by_author[data['author']] = False
+            elif '\\+1' in text:
+                vote_by_author[data['author']] = True
+
+        user_votes = {True: [], False: []}
+        for author, val in vote_by_author.items():
+            user_votes[val].append(author)
+        # Only votes from users that PolicyKit already knows are counted
+        votes_changed = proposal.sync_votes(user_votes, community, RedditUser, create_users=False)
+
+        if votes_changed:
+            schedule_proposal_reevaluation(proposal)
+
+    if new_counts != previous_counts:
+        community.vote_post_comment_counts = new_counts
+        RedditCommunity.objects.filter(pk=community.pk).update(vote_post_comment_counts=new_counts)
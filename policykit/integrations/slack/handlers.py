@@ -5,12 +5,8 @@ from django.dispatch import receiver
 from integrations.slack.models import SlackCommunity, SlackUser
 from metagov.core.signals import governance_process_updated, platform_event_created
 from metagov.plugins.slack.models import Slack, SlackEmojiVote
-from policyengine.models import (
-    BooleanVote,
-    NumberVote,
-    Proposal,
-    ChoiceVote,
-)
+from policyengine.models import Proposal
+from policyengine.tasks import schedule_proposal_reevaluation
 
 logger = logging.getLogger(__name__)
 
@@ -71,30 +67,11 @@ def slack_vote_updated_receiver(sender, instance, status, outcome, errors, **kwa
     votes = outcome["votes"]
     is_boolean_vote = set(votes.keys()) == {"yes", "no"}
 
-    ### Count boolean vote
     if is_boolean_vote:
-        for (vote_option, result) in votes.items():
-            boolean_value = True if vote_option == "yes" else False
-            for u in result["users"]:
-                user, _ = SlackUser.objects.get_or_create(username=u, community=slack_community)
-                existing_vote = BooleanVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user}")
-                    BooleanVote.objects.create(proposal=proposal, user=user, boolean_value=boolean_value)
-                elif existing_vote.boolean_value != boolean_value:
-                    logger.debug(f"Counting boolean vote {boolean_value} by {user} (vote changed)")
-                    existing_vote.boolean_value = boolean_value
-                    existing_vote.save()
-    ### Count choice vote
+        user_votes = {vote_option == "yes": result["users"] for (vote_option, result) in votes.items()}
     else:
-        for (vote_option, result) in votes.items():
-            for u in result["users"]:
-                user, _ = SlackUser.objects.get_or_create(username=u, community=slack_community)
-                existing_vote = ChoiceVote.objects.filter(proposal=proposal, user=user).first()
-                if existing_vote is None:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal}")
-                    ChoiceVote.objects.create(proposal=proposal, user=user, value=vote_option)
-                elif existing_vote.value != vote_option:
-                    logger.debug(f"Counting vote for {vote_option} by {user} for proposal {proposal} (vote changed)")
-                    existing_vote.value = vote_option
-                    existing_vote.save()
+        user_votes = {vote_option: result["users"] for (vote_option, result) in votes.items()}
+    votes_changed = proposal.sync_votes(user_votes, slack_community, SlackUser)
+
+    if votes_changed:
+        schedule_proposal_reevaluation(proposal)
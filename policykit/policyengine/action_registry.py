@@ -0,0 +1,93 @@
+"""
+Registry of the action classes defined by PolicyKit apps, built once per process when the apps are ready
+(see ``policyEngineConfig.ready``), so looking up an action class doesn't scan every model.
+"""
+import threading
+
+from django.apps import apps
+
+
+class ActionRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built = False
+        # codename -> class, for actions in constitution and integration apps
+        self.by_codename = {}
+        # (app label, codename) -> class, for actions in any app
+        self.by_app_codename = {}
+        # app label -> list of GovernableAction / TriggerAction classes
+        self.governable_classes = {}
+        self.trigger_classes = {}
+        # (app label, codename) -> FILTER_PARAMETERS / EXECUTE_VARIABLES of the class
+        self.filter_parameters = {}
+        self.execute_variables = {}
+
+    def build(self):
+        """Index the action classes of all installed apps. Models must be loaded."""
+        from policyengine.models import BaseAction, GovernableAction, TriggerAction
+
+        with self._lock:
+            if self._built:
+                return
+            for app_config in apps.get_app_configs():
+                label = app_config.label
+                self.governable_classes[label] = []
+                self.trigger_classes[label] = []
+                for cls in app_config.get_models():
+                    if not issubclass(cls, BaseAction):
+                        continue
+                    codename = cls._meta.model_name
+                    self.by_app_codename.setdefault((label, codename), cls)
+                    if "constitution" in app_config.name or "integration" in app_config.name:
+                        self.by_codename.setdefault(codename, cls)
+                    if issubclass(cls, GovernableAction):
+                        self.governable_classes[label].append(cls)
+                    if issubclass(cls, TriggerAction):
+                        self.trigger_classes[label].append(cls)
+                    self.filter_parameters[(label, codename)] = getattr(cls, "FILTER_PARAMETERS", [])
+                    self.execute_variables[(label, codename)] = getattr(cls, "EXECUTE_VARIABLES", [])
+            self._built = True
+
+    def _ensure_built(self):
+        if not self._built:
+            self.build()
+
+    def _check_app(self, app_label):
+        if app_label not in self.governable_classes:
+            # Same error as apps.get_app_config
+            raise LookupError(f"No installed app with label '{app_label}'.")
+
+    def find_action_cls(self, codename, app_label=None):
+        self._ensure_built()
+        if app_label:
+            self._check_app(app_label)
+            return self.by_app_codename.get((app_label, codename))
+        return self.by_codename.get(codename)
+
+    def get_action_classes(self, app_label):
+        self._ensure_built()
+        self._check_app(app_label)
+        return list(self.governable_classes[app_label])
+
+    def get_trigger_classes(self, app_label):
+        self._ensure_built()
+        self._check_app(app_label)
+        return list(self.trigger_classes[app_label])
+
+    def get_filter_parameters(self, app_label, codename):
+        self._ensure_built()
+        try:
+            return self.filter_parameters[(app_label, codename)]
+        except KeyError:
+            # Not an action, or not a model at all (apps.get_model raises LookupError)
+            return getattr(apps.get_model(app_label, codename), "FILTER_PARAMETERS", [])
+
+    def get_execute_variables(self, app_label, codename):
+        self._ensure_built()
+        try:
+            return self.execute_variables[(app_label, codename)]
+        except KeyError:
+            return getattr(apps.get_model(app_label, codename), "EXECUTE_VARIABLES", [])
+
+
+action_registry = ActionRegistry()
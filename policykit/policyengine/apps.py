@@ -15,3 +15,17 @@ class policyEngineConfig(AppConfig):
         registry.register(self.get_model('NumberVote'))
         registry.register(self.get_model('Proposal'))
         registry.register(self.get_model('CommunityDoc'))
+
+        # Index the action classes of all apps once, now that every model is loaded
+        from policyengine.action_registry import action_registry
+        action_registry.build()
+
+        # Receive saves and deletes of every CommunityPlatform class, without receiving those of all other models
+        from django.db.models.signals import post_delete, post_save
+        from policyengine.models import CommunityPlatform, invalidate_community_platforms
+        platform_classes = [CommunityPlatform]
+        for cls in platform_classes:
+            platform_classes.extend(cls.__subclasses__())
+        for cls in platform_classes:
+            post_save.connect(invalidate_community_platforms, sender=cls)
+            post_delete.connect(invalidate_community_platforms, sender=cls)
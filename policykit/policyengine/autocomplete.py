@@ -1,4 +1,10 @@
+"""
+Autocomplete strings for the policy editor. They are generated by reflecting over the models, so they are
+built lazily on first use and kept for the life of the process.
+"""
+import hashlib
 import inspect
+from functools import lru_cache
 from inspect import getmembers, isfunction, Parameter
 import policyengine.utils as Utils
 from django.apps import apps
@@ -127,5 +133,39 @@ def generate_evaluation_autocompletes():
     return autocompletes
 
 
-integration_autocompletes = generate_platform_autocompletes()
-general_autocompletes = generate_evaluation_autocompletes()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_integration_autocompletes():
+    """Autocompletes for each platform, see ``generate_platform_autocompletes``. Generated on first use."""
+    return {app_name: tuple(hints) for (app_name, hints) in generate_platform_autocompletes().items()}
+
+
+@lru_cache(maxsize=None)
+def get_general_autocompletes():
+    """Autocompletes for proposal, policy, action, and logger, see ``generate_evaluation_autocompletes``."""
+    return tuple(generate_evaluation_autocompletes())
+
+
+@lru_cache(maxsize=None)
+def get_action_autocompletes(codename):
+    """Autocompletes for the action with the given codename, or an empty tuple if there is no such action."""
+    cls = Utils.find_action_cls(codename)
+    return tuple(generate_action_autocompletes(cls)) if cls else ()
+
+
+@lru_cache(maxsize=None)
+def get_autocompletes_version():
+    """Hash of the generated autocompletes, so cached lists are not reused after the code changes."""
+    hints = list(get_general_autocompletes())
+    for app_name, integration_hints in sorted(get_integration_autocompletes().items()):
+        hints.append(app_name)
+        hints.extend(integration_hints)
+    return hashlib.sha1("\n".join(hints).encode("utf-8")).hexdigest()[:12]
+
+
+def __getattr__(name):
+    # These used to be generated when the module was imported
+    if name == "integration_autocompletes":
+        return get_integration_autocompletes()
+    if name == "general_autocompletes":
+        return list(get_general_autocompletes())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
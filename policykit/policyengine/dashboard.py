@@ -0,0 +1,109 @@
+"""
+Summary of a community shown on the dashboard. It is built with a fixed number of queries, kept in the
+cache for DASHBOARD_CACHE_TIMEOUT seconds, and invalidated when the community's roles, policies or
+proposals change (see the receivers in ``policyengine.models``).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+DASHBOARD_MAX_USERS = 50
+DASHBOARD_MAX_ACTIONS = 20
+
+POLICY_FIELDS = ["pk", "kind", "name", "description", "filter", "initialize", "check", "notify", "success", "fail"]
+
+
+def _cache_key(community_id):
+    return f"policyengine:dashboard:{community_id}"
+
+
+def invalidate_dashboard_summary(community_id):
+    cache.delete(_cache_key(community_id))
+
+
+def get_dashboard_summary(community):
+    """
+    Get the users, roles, documents, policies, pending proposals and recent activity of the community,
+    as plain dicts and lists that can be cached.
+    """
+    key = _cache_key(community.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_dashboard_summary(community)
+        cache.set(key, summary, settings.DASHBOARD_CACHE_TIMEOUT)
+    return summary
+
+
+def build_dashboard_summary(community):
+    from actstream.models import Action
+    from django.contrib.auth.models import Group, User
+    from django.db.models import Count, Prefetch
+    from policyengine.models import BaseAction, CommunityDoc, CommunityRole, CommunityUser, Policy, Proposal
+    from policyengine.templatetags.dashboard_extras import action_types, role_users_string, user_roles, variables
+
+    # List all CommunityUsers across all platforms connected to this community. Only fields of CommunityUser
+    # are shown, so the users don't need to be loaded as their platform's subclass.
+    users = (
+        CommunityUser.objects.non_polymorphic()
+        .filter(community__community=community)
+        .prefetch_related(Prefetch("groups", queryset=Group.objects.select_related("communityrole")))
+        .order_by("pk")[:DASHBOARD_MAX_USERS]
+    )
+
+    roles = (
+        CommunityRole.objects.filter(community=community)
+        .annotate(num_users=Count("user"))
+        .prefetch_related(Prefetch("user_set", queryset=User.objects.select_related("communityuser").order_by("pk")))
+        .order_by("pk")
+    )
+
+    policies = (
+        Policy.objects.filter(community=community, is_active=True)
+        .prefetch_related("action_types", "variables")
+        .order_by("-modified_at")
+    )
+    policies_by_kind = {Policy.PLATFORM: [], Policy.CONSTITUTION: [], Policy.TRIGGER: []}
+    for policy in policies:
+        data = {field: getattr(policy, field) for field in POLICY_FIELDS}
+        data["action_types"] = action_types(policy)
+        data["variables"] = variables(policy)
+        policies_by_kind.setdefault(policy.kind, []).append(data)
+
+    # List pending proposals for all Policies connected to this community. Actions are loaded with the
+    # polymorphic manager in one query, so they are shown as their own class, like proposal.action would be.
+    pending_proposals = list(
+        Proposal.objects.filter(policy__community=community, status=Proposal.PROPOSED)
+        .select_related("policy")
+        .order_by("-proposal_time")
+    )
+    actions = BaseAction.objects.in_bulk({p.action_id for p in pending_proposals})
+
+    # List recent actions across all CommunityPlatforms connected to this community
+    action_log = (
+        Action.objects.filter(policykit_community__community=community)
+        .order_by("-policykit_community__timestamp")
+        .prefetch_related("actor")[:DASHBOARD_MAX_ACTIONS]
+    )
+
+    return {
+        "users": [
+            {
+                "avatar": u.avatar,
+                "readable_name": u.readable_name,
+                "username": u.username,
+                "roles": user_roles(u),
+            }
+            for u in users
+        ],
+        "roles": [{"role_name": role.role_name, "users": role_users_string(role)} for role in roles],
+        "docs": list(CommunityDoc.objects.filter(community=community, is_active=True).values("pk", "name", "text")),
+        "platform_policies": policies_by_kind[Policy.PLATFORM],
+        "constitution_policies": policies_by_kind[Policy.CONSTITUTION],
+        "trigger_policies": policies_by_kind[Policy.TRIGGER],
+        "pending_proposals": [
+            {"action": str(actions[p.action_id]), "policy": str(p.policy), "proposal_time": p.proposal_time}
+            for p in pending_proposals
+        ],
+        "action_log": [
+            {"actor": str(a.actor), "verb": a.verb, "timestamp": a.timestamp} for a in action_log
+        ],
+    }
@@ -1,12 +1,26 @@
+import ast
+import hashlib
 import inspect
 import logging
 import sys
+import threading
+import time
 import traceback
+from collections import OrderedDict
+from functools import lru_cache
 
 from actstream import action as actstream_action
+from django.utils.functional import cached_property
+from django_db_logger.db_log_handler import flush_database_logs
 
 import policyengine.utils as Utils
-from policyengine.safe_exec_code import execute_user_code
+from policyengine.profiler import profiler
+from policyengine.safe_exec_code import (
+    ExecutionBudget,
+    ExecutionBudgetExceeded,
+    compile_user_code,
+    execute_compiled_code,
+)
 
 logger = logging.getLogger(__name__)
 db_logger = logging.getLogger("db")
@@ -20,6 +34,55 @@ class AttrDict(dict):
         super(AttrDict, self).__init__(*args, **kwargs)
         self.__dict__ = self
 
+class CompiledCodeCache:
+    """
+    LRU cache of restricted code objects for policy steps, so the same step isn't recompiled on every evaluation.
+
+    Keys are (policy pk, step name, code hash, argument signature). Because the code hash is part of the key,
+    an entry can never be used for code other than the code it was compiled from, even if the policy
+    was modified in another process. Entries for a policy are dropped when it is saved or deleted.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(policy, step_name, code_string, arg_names):
+        code_hash = hashlib.sha1(code_string.encode("utf-8")).hexdigest()
+        return (getattr(policy, "pk", None), step_name, code_hash, tuple(arg_names))
+
+    def get(self, key):
+        with self._lock:
+            byte_code = self._entries.get(key)
+            if byte_code is not None:
+                self._entries.move_to_end(key)
+            return byte_code
+
+    def set(self, key, byte_code):
+        with self._lock:
+            self._entries[key] = byte_code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_policy(self, policy_pk):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == policy_pk]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+compiled_code_cache = CompiledCodeCache()
+
+
 class EvaluationLogAdapter(logging.LoggerAdapter):
     def process(self, msg, kwargs):
         kwargs["extra"] = self.extra
@@ -31,6 +94,9 @@ class EvaluationContext:
     Class to hold all variables available in a policy evaluation.
     All attributes on this class are in scope and can be used by the policy author.
 
+    Everything except the proposal, action and policy is built lazily on first access, so a step
+    that only touches ``action`` doesn't pay for loading platforms, variables or the Metagov client.
+
     Attributes:
         proposal (Proposal): The proposal representing this evaluation.
         action (BaseAction): The action that triggered this policy evaluation.
@@ -48,8 +114,10 @@ class EvaluationContext:
         variables (Policy.variables): Dict with policy variables keys and values
     """
 
+    # Names that are always in scope (besides the CommunityPlatforms of the community)
+    SCOPE_NAMES = ["proposal", "action", "policy", "metagov", "logger", "variables"]
+
     def __init__(self, proposal):
-        from policyengine.metagov_client import Metagov
         from policyengine.models import ExecutedActionTriggerAction
 
         if isinstance(proposal.action, ExecutedActionTriggerAction):
@@ -58,31 +126,126 @@ class EvaluationContext:
             self.action = proposal.action
 
         self.policy = proposal.policy
-        self.variables = AttrDict()
         self.proposal = proposal
+        self._platforms = {}
 
+    @cached_property
+    def logger(self):
         # Can't use logger in filter step because proposal isn't saved yet
-        if proposal.pk:
-            self.logger = EvaluationLogAdapter(
-                db_logger, {"community": self.action.community.community, "proposal": proposal}
-            )
+        if not self.proposal.pk:
+            raise AttributeError("logger")
+        return EvaluationLogAdapter(
+            db_logger, {"community": self.action.community.community, "proposal": self.proposal}
+        )
+
+    @cached_property
+    def metagov(self):
+        from policyengine.metagov_client import Metagov
+
+        return Metagov(self.proposal)
+
+    @cached_property
+    def variables(self):
+        # Make policy variables available in the evaluation context
+        return AttrDict({variable.name: variable.get_variable_values() for variable in self.policy.variables.all()})
+
+    def get_platform(self, name):
+        """
+        Get the CommunityPlatform named ``name`` (like "slack" or "opencollective") with its proposal
+        functions shimmed, or None if the community isn't connected to that platform.
+        """
+        if name not in self._platforms:
+            self._platforms[name] = _load_community_platform(self.action.community.community_id, name, self.proposal)
+        return self._platforms[name]
+
+    def get_scope(self, names):
+        """
+        Get a dict of the values in scope for the given names. Names that are not in scope are left out.
+        """
+        scope = {}
+        for name in sorted(names):
+            if name in self.SCOPE_NAMES:
+                if name == "logger" and not self.proposal.pk:
+                    continue
+                scope[name] = getattr(self, name)
+            else:
+                platform = self.get_platform(name)
+                if platform is not None:
+                    scope[name] = platform
+        return scope
+
+    def __getattr__(self, name):
+        # Make the CommunityPlatforms available as attributes, like "context.slack"
+        if name.startswith("_"):
+            raise AttributeError(name)
+        platform = self.get_platform(name)
+        if platform is None:
+            raise AttributeError(name)
+        return platform
+
+
+# Per-process index of community pk -> {platform name: (CommunityPlatform subclass, pk)}
+_community_platform_index = {}
+# Per-process cache of community pk -> {name: time until which it's known not to be a platform of the community}
+_missing_community_platforms = {}
+# Per-process cache of (CommunityPlatform subclass, function name) -> whether the function should be shimmed
+_shimmed_function_cache = {}
+
+
+def _get_community_platform_index(community_id, refresh=False):
+    from django.contrib.contenttypes.models import ContentType
+
+    from policyengine.models import CommunityPlatform
+
+    index = _community_platform_index.get(community_id)
+    if index is None or refresh:
+        index = {}
+        rows = (
+            CommunityPlatform.objects.non_polymorphic()
+            .filter(community_id=community_id)
+            .values_list("pk", "polymorphic_ctype_id")
+        )
+        for pk, ctype_id in rows:
+            cls = ContentType.objects.get_for_id(ctype_id).model_class()
+            index[cls.platform] = (cls, pk)
+        _community_platform_index[community_id] = index
+    return index
+
 
-        from policyengine.models import Community, CommunityPlatform
+def invalidate_community_platforms(community_id):
+    """Forget the cached platforms for a community. Called when a CommunityPlatform is saved or deleted."""
+    _community_platform_index.pop(community_id, None)
+    _missing_community_platforms.pop(community_id, None)
 
-        parent_community: Community = self.action.community.community
 
-        for comm in CommunityPlatform.objects.filter(community=parent_community):
-            for function_name in Utils.SHIMMED_PROPOSAL_FUNCTIONS:
-                _shim_proposal_function(comm, proposal, function_name)
-            # Make the CommunityPlatforms available in the evaluation context,
-            # so policy author can access them as vars like "slack" and "opencollective"
-            setattr(self, comm.platform, comm)
+def _load_community_platform(community_id, name, proposal):
+    from django.conf import settings
 
-        self.metagov = Metagov(proposal)
-               
-         # Make policy variables available in the evaluation context
-        setattr(self, "variables", AttrDict({ variable.name : variable.get_variable_values() for variable in self.policy.variables.all() or []}))
+    index = _get_community_platform_index(community_id)
+    if name not in index:
+        # Names that aren't platforms of the community, like local variables of the policy code, are
+        # remembered for POLICY_INDEX_CACHE_TIMEOUT seconds, so they aren't looked up on every evaluation
+        missing = _missing_community_platforms.setdefault(community_id, {})
+        if missing.get(name, 0) > time.monotonic():
+            return None
+        # The platform may have been added by another process since the index was built
+        if name in Utils.get_platform_integrations() or name == "constitution":
+            index = _get_community_platform_index(community_id, refresh=True)
+        if name not in index:
+            missing[name] = time.monotonic() + settings.POLICY_INDEX_CACHE_TIMEOUT
+            return None
 
+    cls, pk = index[name]
+    try:
+        community_platform = cls.objects.get(pk=pk)
+    except cls.DoesNotExist:
+        # The platform was deleted by another process since the index was built
+        invalidate_community_platforms(community_id)
+        return None
+
+    for function_name in Utils.SHIMMED_PROPOSAL_FUNCTIONS:
+        _shim_proposal_function(community_platform, proposal, function_name)
+    return community_platform
 
 
 class PolicyEngineError(Exception):
@@ -118,24 +281,74 @@ class PolicyDoesNotPassFilter(PolicyEngineError):
     pass
 
 
+def _policy_index_cache_key(community_id):
+    return f"policyengine:policy_index:{community_id}"
+
+
+def get_policy_index(community_id):
+    """
+    Get the index of active policies for a community, mapping (kind, action codename) to a list of policy pks
+    ordered by most recently modified. Policies with no action types (base policies) are stored under (kind, None).
+
+    The index lives in the Django cache so it's shared between web and celery processes. It's invalidated
+    when a Policy or its action types change, see ``invalidate_policy_index``. Only pks are cached: the
+    policies themselves are loaded on every evaluation, so a stale index (for example in a process with its
+    own local memory cache) never runs deleted or deactivated policies, or outdated code.
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+
+    from policyengine.models import Policy
+
+    key = _policy_index_cache_key(community_id)
+    index = cache.get(key)
+    if index is None:
+        index = {}
+        rows = (
+            Policy.objects.filter(community_id=community_id, is_active=True)
+            .order_by("-modified_at", "pk")
+            .values_list("pk", "kind", "action_types__codename")
+        )
+        for pk, kind, codename in rows:
+            # One row per action type, or a single row with a codename of None
+            pks = index.setdefault((kind, codename), [])
+            if pk not in pks:
+                pks.append(pk)
+        cache.set(key, index, settings.POLICY_INDEX_CACHE_TIMEOUT)
+    return index
+
+
+def invalidate_policy_index(community_id):
+    from django.core.cache import cache
+
+    cache.delete(_policy_index_cache_key(community_id))
+
+
 def get_eligible_policies(action):
-    from django.db.models import Q
+    """
+    Get a list of active policies that could govern (or be triggered by) the action, most recently modified first.
+    """
+    from policyengine.models import ExecutedActionTriggerAction, Policy, PolicyActionKind
 
-    from policyengine.models import ExecutedActionTriggerAction, PolicyActionKind
+    community_id = action.community.community_id
+    index = get_policy_index(community_id)
 
     if action.kind == PolicyActionKind.TRIGGER:
         # Trigger policies MUST match the trigger action. There is no "base policy" concept for triggers.
         if isinstance(action, ExecutedActionTriggerAction):
-            action_type_match = Q(action_types__codename=action.action.action_type)
+            codename = action.action.action_type
         else:
-            action_type_match = Q(action_types__codename=action.action_type)
+            codename = action.action_type
+        policy_pks = index.get((action.kind, codename), [])
     else:
         # Governing policies can match if they have NO action_types specified (meaning its the "base policy")
-        action_type_match = Q(action_types=None) | Q(action_types__codename=action.action_type)
+        policy_pks = index.get((action.kind, action.action_type), []) + index.get((action.kind, None), [])
 
-    eligible_policies = action.community.community.get_policies().filter(Q(kind=action.kind) & action_type_match)
+    # Load the policies in one query, skipping any that were deactivated or deleted since the index was built
+    policies = Policy.objects.filter(community_id=community_id, is_active=True).in_bulk(set(policy_pks))
+    eligible_policies = sorted(policies.values(), key=lambda policy: policy.modified_at, reverse=True)
 
-    logger.debug(f"{action.kind} action '{action}' found {eligible_policies.count()} eligible policies")
+    logger.debug(f"{action.kind} action '{action}' found {len(eligible_policies)} eligible policies")
     return eligible_policies
 
 
@@ -155,7 +368,7 @@ def evaluate_action(action):
     from policyengine.models import PolicyActionKind
 
     eligible_policies = get_eligible_policies(action)
-    if not eligible_policies.exists():
+    if not eligible_policies:
         if action.kind != PolicyActionKind.TRIGGER:
             raise Exception(f"no eligible policies found for governable action '{action}'")
         else:
@@ -164,75 +377,73 @@ def evaluate_action(action):
     # If this is a trigger action, evaluate ALL eligible policies
     if action.kind == PolicyActionKind.TRIGGER:
         proposals = []
-        matching_policies_proposals = create_prefiltered_proposals(action, eligible_policies, allow_multiple=True)
-        for proposal in matching_policies_proposals:
-            try:
-                evaluate_proposal(proposal, is_first_evaluation=True)
-            except Exception as e:
-                logger.debug(f"{proposal} raised exception {type(e).__name__} {e}")
-                proposal.delete()
-            else:
+        for context in prefilter_policies(action, eligible_policies):
+            proposal = _evaluate_new_proposal(context)
+            if proposal:
                 proposals.append(proposal)
         return proposals
 
-    # If this is a governable action, choose ONE policy to evaluate
+    # If this is a governable action, choose ONE policy to evaluate.
+    # Policies are tried in order and each Filter step runs at most once, so a policy that
+    # raises during evaluation just hands the action to the next policy that passes its Filter.
     else:
-        while eligible_policies.exists():
-            proposal = create_prefiltered_proposals(action, eligible_policies)
-            if not proposal:
-                # This means that the action didn't pass the filter for ANY policies.
-                logger.warn(f"Governable action {action} did not pass Filter for any eligible policies.")
-                return None
-
-            # Run the proposal
-            try:
-                evaluate_proposal(proposal, is_first_evaluation=True)
-            except Exception as e:
-                eligible_policies = eligible_policies.exclude(pk=proposal.policy.pk)
-                logger.debug(f"{proposal} raised exception {type(e).__name__} {e}, choosing a different policy...")
-                proposal.delete()
-                pass
-            else:
+        for context in prefilter_policies(action, eligible_policies):
+            logger.debug(f"For action '{action}', choosing policy '{context.policy}'")
+            proposal = _evaluate_new_proposal(context)
+            if proposal:
                 return proposal
+            logger.debug(f"Choosing a different policy for action '{action}'...")
+
+        # This means that the action didn't pass the filter for ANY policies (or they all raised).
+        logger.warn(f"Governable action {action} did not pass Filter for any eligible policies.")
+        return None
 
 
-def create_prefiltered_proposals(action, policies, allow_multiple=False):
+def prefilter_policies(action, policies):
     """
-    Evaluate action against the Filter step in all provided policies, and return the Proposal
-    for the first Policy where the aciton passed the Filter.
+    Evaluate action against the Filter step of the provided policies, in order. Yields an EvaluationContext
+    holding an unsaved Proposal for each Policy where the action passed the Filter.
 
-    If allow_multiple is true, returns a *list* of all Proposals where the action passed the filter (used for Triggers).
+    This is a generator, so policies after the one the caller stops at are never filtered.
     """
     from policyengine.models import Policy, Proposal
 
-    proposals = []
     for policy in policies:
         proposal = Proposal(policy=policy, action=action, status=Proposal.PROPOSED)
         context = EvaluationContext(proposal)
         try:
             passed_filter = exec_code_block(policy.filter, context, Policy.FILTER)
         except Exception as e:
-            # Log unhandled exception to the db, so policy author can view it in the UI.
-            context.logger.error(f"Exception in 'filter': {str(e)}")
+            # The proposal isn't saved yet, so this can't be logged to the db for the policy author.
+            logger.error(f"Exception in 'filter' of {policy}: {str(e)}")
             # If there was an exception raised in 'filter', treat it as if the action didn't pass this policy's filter.
             continue
 
         if passed_filter:
-            # Defer saving trigger actions and proposals until we need to, so we don't bloat the database
-            if not action.pk:
-                action.save()
-            proposal.save()
-            if allow_multiple:
-                proposals.append(proposal)
-            else:
-                logger.debug(f"For action '{action}', choosing policy '{policy}'")
-                return proposal
+            yield context
 
-    if allow_multiple:
-        return proposals
-    else:
-        logger.warn(f"No matching policy for {action}")
+
+def _evaluate_new_proposal(context):
+    """
+    Save and run the first evaluation of a Proposal whose action already passed the Filter step.
+    The Proposal is only saved once it is about to be evaluated, and deleted if the evaluation raises.
+    Returns the Proposal, or None if the evaluation raised.
+    """
+    proposal = context.proposal
+    action = proposal.action
+
+    # Defer saving trigger actions and proposals until we need to, so we don't bloat the database
+    if not action.pk:
+        action.save()
+    proposal._save_evaluation()
+
+    try:
+        evaluate_proposal(proposal, is_first_evaluation=True, context=context, passed_filter=True)
+    except Exception as e:
+        logger.debug(f"{proposal} raised exception {type(e).__name__} {e}")
+        proposal.delete()
         return None
+    return proposal
 
 
 def delete_and_rerun(proposal):
@@ -246,9 +457,12 @@ def delete_and_rerun(proposal):
     return new_evaluation
 
 
-def evaluate_proposal(proposal, is_first_evaluation=False):
+def evaluate_proposal(proposal, is_first_evaluation=False, context=None, passed_filter=False):
     """
     Evaluate policy for given action. This can be run repeatedly to check proposed actions.
+
+    An existing EvaluationContext for the proposal can be passed in to be reused. If passed_filter is True,
+    the caller has just run the Filter step for this proposal, and it isn't run again.
     """
 
     if not proposal.policy:
@@ -258,10 +472,15 @@ def evaluate_proposal(proposal, is_first_evaluation=False):
     if not proposal.policy.is_active:
         raise PolicyIsNotActive
 
-    context = EvaluationContext(proposal)
+    from policyengine.models import DataStore
+
+    if context is None:
+        context = EvaluationContext(proposal)
 
     try:
-        return evaluate_proposal_inner(context, is_first_evaluation)
+        # Save changes to proposal.data once, at the end of the evaluation
+        with DataStore.batch_writes(), profiler.profile(proposal.policy, "evaluation"):
+            return evaluate_proposal_inner(context, is_first_evaluation, passed_filter)
     except PolicyDoesNotPassFilter:
         # The policy changed so that the action no longer passes the 'filter' step
         raise
@@ -274,9 +493,13 @@ def evaluate_proposal(proposal, is_first_evaluation=False):
         # Log unhandled exception to the db, so policy author can view it in the UI.
         context.logger.error(f"Unhandled exception: {repr(e)} {e}")
         raise
+    finally:
+        # Write all the logs from this evaluation in one batch
+        flush_database_logs()
+        profiler.flush(force=False)
 
 
-def evaluate_proposal_inner(context: EvaluationContext, is_first_evaluation: bool):
+def evaluate_proposal_inner(context: EvaluationContext, is_first_evaluation: bool, passed_filter: bool = False):
     from policyengine.models import Policy, Proposal
 
     proposal = context.proposal
@@ -286,7 +509,7 @@ def evaluate_proposal_inner(context: EvaluationContext, is_first_evaluation: boo
     logger.debug('*')
     logger.debug(action.__dict__)
 
-    if not exec_code_block(policy.filter, context, Policy.FILTER):
+    if not passed_filter and not exec_code_block(policy.filter, context, Policy.FILTER):
         # logger.debug("does not pass filter")
         raise PolicyDoesNotPassFilter
 
@@ -343,16 +566,17 @@ def evaluate_proposal_inner(context: EvaluationContext, is_first_evaluation: boo
 def exec_code_block(code_string: str, context: EvaluationContext, step_name="unknown"):
     """
     Execute a policy step with all the available context. Uses restricted safe execution
-    to limit available modules.
+    to limit available modules. Compiled steps are cached in ``compiled_code_cache``.
     """
-    # Each item on the EvaluationContext gets passed to the funciton as a keyword argument
-    args = ", ".join(context.__dict__.keys())
-    wrapper_start = f"def {step_name}({args}):\r\n"
-    lines = ["  " + item for item in code_string.splitlines()]
-    code = wrapper_start + "\r\n".join(lines)
-
     try:
-        return execute_user_code(code, step_name, **context.__dict__)
+        with profiler.profile(context.policy, step_name):
+            # Each item on the EvaluationContext that the code uses gets passed to the function as a keyword argument
+            scope = context.get_scope(_get_referenced_names(code_string))
+            byte_code = _get_compiled_code_block(code_string, context.policy, step_name, scope.keys())
+            return execute_compiled_code(byte_code, budget=_get_step_budget(), **scope)
+    except ExecutionBudgetExceeded as err:
+        _record_budget_exceeded(context.policy, step_name, err)
+        raise PolicyCodeError(step=step_name, message=f"{step_name} step was stopped: {err}")
     except SyntaxError as err:
         error_class = err.__class__.__name__
         detail = err.args[0]
@@ -372,6 +596,63 @@ def exec_code_block(code_string: str, context: EvaluationContext, step_name="unk
         )
 
 
+def _get_step_budget():
+    from django.conf import settings
+
+    return ExecutionBudget(
+        timeout=settings.POLICY_STEP_TIMEOUT,
+        max_steps=settings.POLICY_STEP_MAX_STEPS,
+        max_result_size=settings.POLICY_STEP_MAX_RESULT_SIZE,
+    )
+
+
+def _record_budget_exceeded(policy, step_name, err):
+    """Count the violation on the policy, so operators can find the policies that hold up evaluation."""
+    from django.db.models import F
+    from django.utils import timezone
+
+    from policyengine.models import Policy
+
+    logger.warning(f"{step_name} step of policy {policy.pk} was stopped: {err}")
+    if policy.pk:
+        Policy.objects.filter(pk=policy.pk).update(
+            budget_exceeded_count=F("budget_exceeded_count") + 1, budget_exceeded_at=timezone.now()
+        )
+
+
+def _wrap_code_block(code_string, step_name, arg_names):
+    wrapper_start = f"def {step_name}({', '.join(arg_names)}):\r\n"
+    lines = ["  " + item for item in code_string.splitlines()]
+    return wrapper_start + "\r\n".join(lines)
+
+
+@lru_cache(maxsize=1024)
+def _get_referenced_names(code_string):
+    """
+    Get the set of names used in a policy step, so only the parts of the EvaluationContext
+    that the step uses need to be built. Returns an empty set for code that doesn't parse,
+    since compiling it will raise a SyntaxError regardless of its arguments.
+    """
+    try:
+        tree = ast.parse(_wrap_code_block(code_string, "step", []))
+    except SyntaxError:
+        return frozenset()
+    return frozenset(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+
+
+def _get_compiled_code_block(code_string, policy, step_name, arg_names):
+    """
+    Get the compiled wrapper function for a policy step, compiling it on a cache miss.
+    Code that fails to compile is not cached, so the SyntaxError is raised on every attempt.
+    """
+    key = CompiledCodeCache.make_key(policy, step_name, code_string, arg_names)
+    byte_code = compiled_code_cache.get(key)
+    if byte_code is None:
+        byte_code = compile_user_code(_wrap_code_block(code_string, step_name, arg_names), step_name)
+        compiled_code_cache.set(key, byte_code)
+    return byte_code
+
+
 def sanitize_check_result(res):
     from policyengine.models import Proposal
 
@@ -400,9 +681,15 @@ def _shim_proposal_function(community_platform, proposal, function_name):
     # store the original function that we will shim
     old_function = getattr(community_platform, function_name)
 
-    # skip if this function doesn't expect 'parameter' as the first arg
-    function_parameters = list(inspect.signature(old_function).parameters.values())
-    if not len(function_parameters) > 1 and function_parameters[1].name == "proposal":
+    # skip if this function doesn't expect 'parameter' as the first arg.
+    # The signature only depends on the class, so inspect it once per process.
+    cache_key = (type(community_platform), function_name)
+    if cache_key not in _shimmed_function_cache:
+        function_parameters = list(inspect.signature(old_function).parameters.values())
+        _shimmed_function_cache[cache_key] = not (
+            not len(function_parameters) > 1 and function_parameters[1].name == "proposal"
+        )
+    if not _shimmed_function_cache[cache_key]:
         return
 
     # create a shim function that passes the proposal
@@ -410,6 +410,7 @@ def generate_execution_codes(executions):
             }
         ],
     """
+    from policyengine.action_registry import action_registry
     from policyengine.utils import find_action_cls
     execution_codes = []
     for execution in executions:
@@ -429,7 +430,7 @@ def generate_execution_codes(executions):
             action_codename = execution["action"]
             this_action = find_action_cls(action_codename)
             if hasattr(this_action, "execution_codes"):
-                execute_variables = this_action.EXECUTE_VARIABLES
+                execute_variables = action_registry.get_execute_variables(this_action._meta.app_label, action_codename)
                 execution = force_execution_variable_types(execution, execute_variables)
                 codes += this_action.execution_codes(**execution)
             else:
@@ -1,9 +1,27 @@
-from pylint.lint import Run
-from pylint.reporters.text import TextReporter
-import tempfile
+"""
+Linter for policy code, used by the policy editor.
+
+``_lint_check`` runs in process: it parses the code inside the same wrapper function the engine runs it in,
+and reports syntax errors, undefined names and constructs that RestrictedPython doesn't allow. Results are
+cached by code hash. Pylint is only run as an optional deep check, in a celery worker, see
+``get_deep_lint_errors``.
+
+Errors are formatted like pylint messages ("line:column: code: message (symbol)"), because the editor reads
+the line number from the start of each message.
+"""
+import ast
+import builtins
+import hashlib
+import keyword
 import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+
 import policyengine.utils as Utils
-from policyengine.safe_exec_code import policykit_builtins, STATIC_GLOBAL_VARIABLES
+from policyengine.safe_exec_code import OwnRestrictingNodeTransformer, STATIC_GLOBAL_VARIABLES, policykit_builtins
 
 
 defined_variables = (
@@ -19,6 +37,143 @@ defined_variables = (
     + Utils.get_platform_integrations() # not all of these are necessarily defined
 )
 
+# Names that are never reported as undefined. Python builtins are included like pylint did,
+# so the editor doesn't start flagging code that used to lint cleanly.
+_known_names = frozenset(defined_variables) | frozenset(dir(builtins))
+
+# Errors from RestrictingNodeTransformer look like "Line 3: ..."
+_restricted_error_re = re.compile(r"^Line (\d+): (.*)$", re.DOTALL)
+
+
+def _cache_key(kind, code, function_name):
+    code_hash = hashlib.sha1(f"{function_name}\0{code}".encode("utf-8")).hexdigest()
+    return f"policyengine:lint:{kind}:{code_hash}"
+
+
+def _wrap(code, function_name):
+    """
+    Wrap the code in a function like ``engine._wrap_code_block``, so 'return' is allowed. Adds 1 line and 2 columns.
+    A 'pass' is added at the end, so code that is empty or only has comments is valid.
+    """
+    lines = ["  " + line for line in code.splitlines()]
+    return f"def {function_name}():\n" + "\n".join(lines + ["  pass"])
+
+
+def _position(lineno, col_offset):
+    """Line and column in the code as written, from a position in the wrapped code"""
+    return max((lineno or 1) - 1, 1), max((col_offset or 0) - 2, 0)
+
+
+def _syntax_error_message(err):
+    line, col = _position(err.lineno, err.offset)
+    # Some messages mention a line number of the wrapped code
+    msg = re.sub(r"(?<=line )(\d+)", lambda match: str(_position(int(match.group(1)), 0)[0]), err.msg)
+    return f"{line}:{col}: E0001: {msg} (<unknown>, line {line}) (syntax-error)"
+
+
+def _undefined_names(statements):
+    """Find names that are read but never bound in the code, and aren't provided to policy code."""
+    bound = set()
+    loaded = []
+    for node in (node for statement in statements for node in ast.walk(statement)):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.append(node)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.alias):
+            bound.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif getattr(node, "name", None) and type(node).__name__ in ("MatchAs", "MatchStar"):
+            bound.add(node.name)
+        elif type(node).__name__ == "MatchMapping" and node.rest:
+            bound.add(node.rest)
+
+    return [node for node in loaded if node.id not in bound and node.id not in _known_names]
+
+
+def _check(code, function_name):
+    if not function_name.isidentifier() or keyword.iskeyword(function_name):
+        function_name = "policy_step"
+    try:
+        tree = ast.parse(_wrap(code, function_name), filename="<unknown>")
+        # Errors that are only raised by the compiler, like 'break' outside a loop
+        compile(tree, "<unknown>", "exec")
+    except SyntaxError as err:
+        return [_syntax_error_message(err)]
+
+    errors = []
+    # The body of the wrapper function is the code as written
+    for node in _undefined_names(tree.body[0].body):
+        line, col = _position(node.lineno, node.col_offset)
+        errors.append(f"{line}:{col}: E0602: Undefined variable '{node.id}' (undefined-variable)")
+
+    # Check the constructs that compile_user_code rejects, with the same node transformer
+    restricted_errors = []
+    try:
+        OwnRestrictingNodeTransformer(restricted_errors, [], set()).visit(tree)
+    except SyntaxError as err:
+        # Raised for import statements
+        restricted_errors = [f"Line {err.lineno}: {err.msg}"]
+    for error in restricted_errors:
+        match = _restricted_error_re.match(error)
+        if match:
+            line, _ = _position(int(match.group(1)), 0)
+            errors.append(f"{line}:0: E0010: {match.group(2)} (restricted-code)")
+        else:
+            errors.append(f"1:0: E0010: {error} (restricted-code)")
+
+    return sorted(errors, key=lambda error: int(error.split(":", 1)[0]))
+
+
+def _lint_check(code, function_name="filter"):
+    """
+    Checks provided Python code for errors, without running pylint. Returns a list of errors.
+    """
+    key = _cache_key("fast", code, function_name)
+    errors = cache.get(key)
+    if errors is None:
+        errors = _check(code, function_name)
+        cache.set(key, errors, settings.POLICY_LINT_CACHE_TIMEOUT)
+    return errors
+
+
+def get_deep_lint_errors(code, function_name="filter"):
+    """
+    Get the errors that pylint finds in the code, or None if pylint hasn't finished checking it yet.
+    Pylint is slow, so it runs in a celery worker. Its task id is derived from the code hash, so any web
+    process can read the result from the celery result backend, whichever process started the check.
+    """
+    from policyengine.tasks import deep_lint_check
+
+    key = _cache_key("deep", code, function_name)
+    errors = cache.get(key)
+    if errors is not None:
+        return errors
+
+    task_id = key.replace(":", "-")
+    result = deep_lint_check.AsyncResult(task_id)
+    # cache.add only succeeds if this process hasn't started a check of the code recently
+    if not result.successful() and cache.add(
+        _cache_key("deep-pending", code, function_name), True, settings.POLICY_LINT_DEEP_TIMEOUT
+    ):
+        result = deep_lint_check.apply_async((code, function_name), task_id=task_id)
+    # When tasks run eagerly, the result is already there
+    if not result.successful():
+        return None
+
+    errors = result.result
+    cache.set(key, errors, settings.POLICY_LINT_CACHE_TIMEOUT)
+    return errors
+
+
 def should_keep_error_message(error_message, function_name):
     """
     Checks provided error message and returns whether or not the error message
@@ -42,7 +197,7 @@ def should_keep_error_message(error_message, function_name):
 class PylintOutput:
     """
     Used internally to write output / error messages to a list
-    from the TextReporter object in _lint_check(code).
+    from the TextReporter object in _pylint_check(code).
     """
     def __init__(self):
         self.output = []
@@ -53,11 +208,13 @@ class PylintOutput:
     def read(self):
         return self.output
 
-def _lint_check(code, function_name = 'filter'):
+def _pylint_check(code, function_name = 'filter'):
     """
-    Checks provided Python code for errors. Syntax errors are checked for with
-    Pylint. Returns a list of errors from linting.
+    Checks provided Python code for errors with Pylint. Returns a list of errors from linting.
     """
+    from pylint.lint import Run
+    from pylint.reporters.text import TextReporter
+
     # Since Pylint can only be used on files and not strings directly, we must
     # save the code to a temporary file. The file will be deleted after we are
     # finished.
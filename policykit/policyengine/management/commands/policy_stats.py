@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from policyengine.models import Community, PolicyStepStats
+from policyengine.profiler import profiler
+
+
+class Command(BaseCommand):
+    help = "Prints the most time consuming policy steps, from the statistics recorded by the policy profiler"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--minutes", type=int, default=60, help="How far back to look (default 60)")
+        parser.add_argument("--community", type=int, help="Only show policies of the community with this pk")
+        parser.add_argument("--limit", type=int, default=20, help="Maximum number of rows to print (default 20)")
+
+    def handle(self, *args, **options):
+        # Include statistics still held in memory by this process
+        profiler.flush()
+
+        community = None
+        if options["community"] is not None:
+            community = Community.objects.get(pk=options["community"])
+
+        since = timezone.now() - timedelta(minutes=options["minutes"])
+        rows = PolicyStepStats.summarize(since, community=community)[: options["limit"]]
+        if not rows:
+            self.stdout.write(self.style.NOTICE(f"No policy steps ran in the last {options['minutes']} minutes."))
+            return
+
+        self.stdout.write(
+            f"{'policy':<40} {'step':<12} {'runs':>7} {'total s':>9} {'avg ms':>9} {'max ms':>9} "
+            f"{'queries':>8} {'max q':>6} {'calls':>6}"
+        )
+        for row in rows:
+            name = f"{row['policy__name']} ({row['policy_id']})"[:40]
+            self.stdout.write(
+                f"{name:<40} {row['step']:<12} {row['count']:>7} {row['total_time']:>9.3f} "
+                f"{row['avg_time'] * 1000:>9.1f} {row['max_time'] * 1000:>9.1f} "
+                f"{row['queries']:>8} {row['max_queries']:>6} {row['platform_calls']:>6}"
+            )
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0018_auto_20230521_1821'),
+        ('policyengine', '0019_auto_20230523_1804'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proposal',
+            name='next_evaluation_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='proposal',
+            index=models.Index(fields=['status', 'next_evaluation_at'], name='proposal_status_next_eval_idx'),
+        ),
+    ]
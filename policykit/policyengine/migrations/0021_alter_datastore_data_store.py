@@ -0,0 +1,25 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+def fill_empty_data_stores(apps, schema_editor):
+    # Empty strings aren't valid JSON, so they can't be converted to a JSONField
+    DataStore = apps.get_model('policyengine', 'DataStore')
+    DataStore.objects.filter(data_store='').update(data_store='{}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0020_proposal_next_evaluation_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_empty_data_stores, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='datastore',
+            name='data_store',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0022_proposal_vote_tally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogAPICallMatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('call_time', models.DateTimeField()),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_keys', to='policyengine.logapicall')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='logapicallmatch',
+            index=models.Index(fields=['key', 'call_time'], name='logapicallmatch_key_time_idx'),
+        ),
+    ]
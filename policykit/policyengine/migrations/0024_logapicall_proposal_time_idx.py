@@ -0,0 +1,17 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0023_logapicallmatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logapicall',
+            index=models.Index(fields=['proposal_time'], name='logapicall_proposal_time_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0024_logapicall_proposal_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='policy',
+            name='budget_exceeded_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='policy',
+            name='budget_exceeded_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0025_policy_budget_exceeded'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyStepStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(max_length=30)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_time', models.FloatField(default=0)),
+                ('max_time', models.FloatField(default=0)),
+                ('total_queries', models.PositiveIntegerField(default=0)),
+                ('max_queries', models.PositiveIntegerField(default=0)),
+                ('total_platform_calls', models.PositiveIntegerField(default=0)),
+                ('policy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='policyengine.policy')),
+            ],
+            options={
+                'unique_together': {('policy', 'step', 'bucket')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='policystepstats',
+            index=models.Index(fields=['bucket'], name='policystepstats_bucket_idx'),
+        ),
+    ]
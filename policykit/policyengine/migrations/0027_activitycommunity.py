@@ -0,0 +1,48 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_activity_communities(apps, schema_editor):
+    # The activity stream's 'data' field is added at runtime when USE_JSONFIELD is set,
+    # so it isn't on the historical model
+    from actstream.models import Action
+
+    CommunityPlatform = apps.get_model('policyengine', 'CommunityPlatform')
+    ActivityCommunity = apps.get_model('policyengine', 'ActivityCommunity')
+
+    platform_communities = dict(CommunityPlatform.objects.values_list('pk', 'community_id'))
+    batch = []
+    for pk, timestamp, data in Action.objects.order_by().values_list('pk', 'timestamp', 'data').iterator():
+        community_id = platform_communities.get((data or {}).get('community_id'))
+        if community_id:
+            batch.append(ActivityCommunity(action_id=pk, community_id=community_id, timestamp=timestamp))
+        if len(batch) >= 1000:
+            ActivityCommunity.objects.bulk_create(batch)
+            batch = []
+    ActivityCommunity.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actstream', '__first__'),
+        ('policyengine', '0026_policystepstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityCommunity',
+            fields=[
+                ('action', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='policykit_community', serialize=False, to='actstream.action')),
+                ('timestamp', models.DateTimeField()),
+                ('community', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='policyengine.community')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='activitycommunity',
+            index=models.Index(fields=['community', '-timestamp'], name='activitycommunity_recent_idx'),
+        ),
+        migrations.RunPython(fill_activity_communities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policyengine', '0027_activitycommunity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proposal',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,13 +1,21 @@
+import copy
+import hashlib
 import json
 import logging
-from datetime import datetime, timezone
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 from actstream import action as actstream_action
+from django.conf import settings
 from django.contrib.auth.models import Group, User, UserManager
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import CharField, Count, Value
 from django.db.models.deletion import CASCADE
-from django.db.models.signals import post_delete, pre_delete
+from django.db.models.functions import Cast
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.forms import ModelForm
 from metagov.core.models import GovernanceProcess
@@ -15,7 +23,9 @@ from polymorphic.models import PolymorphicManager, PolymorphicModel
 
 import policyengine.utils as Utils
 from policyengine import engine
+from policyengine.dashboard import invalidate_dashboard_summary
 from policyengine.metagov_app import metagov
+from policyengine.profiler import profiler
 
 logger = logging.getLogger(__name__)
 
@@ -123,6 +133,8 @@ class CommunityPlatform(PolymorphicModel):
 
     @property
     def metagov_plugin(self):
+        # Plugins are fetched to call them, so count it as a platform call
+        profiler.count_platform_call()
         mg_community = metagov.get_community(self.metagov_slug)
         team_id = getattr(self, "team_id", None)
         return mg_community.get_plugin(self.platform, community_platform_id=team_id)
@@ -356,17 +368,45 @@ class CommunityDoc(models.Model):
 class DataStore(models.Model):
     """DataStore used for persisting serializable data on a Proposal."""
 
-    data_store = models.TextField()
+    data_store = models.JSONField(default=dict, blank=True)
+
+    # DataStores with unsaved changes, for each thread that is inside batch_writes()
+    _batch = threading.local()
+
+    @classmethod
+    @contextmanager
+    def batch_writes(cls):
+        """
+        Context manager that defers saving DataStores until the end of the block, so that several
+        ``set`` and ``remove`` calls on the same DataStore only cause one UPDATE. Used around each policy evaluation.
+
+        :meta private:
+        """
+        if getattr(cls._batch, "dirty", None) is not None:
+            # Already batching, the outermost block saves
+            yield
+            return
+
+        cls._batch.dirty = {}
+        try:
+            yield
+        finally:
+            dirty, cls._batch.dirty = cls._batch.dirty, None
+            for data_store in dirty.values():
+                data_store.save(update_fields=["data_store"])
 
     def _get_data_store(self):
-        if self.data_store != '':
-            return json.loads(self.data_store)
+        if not isinstance(self.data_store, dict):
+            self.data_store = {}
+        return self.data_store
+
+    def _data_store_changed(self):
+        dirty = getattr(DataStore._batch, "dirty", None)
+        if dirty is None or self.pk is None:
+            self.save()
         else:
-            return {}
-
-    def _set_data_store(self, obj):
-        self.data_store = json.dumps(obj)
-        self.save()
+            # One entry per row, the copy changed last is the one written
+            dirty[self.pk] = self
 
     def get(self, key):
         """
@@ -378,7 +418,8 @@ class DataStore(models.Model):
             The key associated with the value.
         """
         obj = self._get_data_store()
-        return obj.get(key, None)
+        # Return a copy, so changing the value doesn't change the store without calling set
+        return copy.deepcopy(obj.get(key, None))
 
     def set(self, key, value):
         """
@@ -392,8 +433,9 @@ class DataStore(models.Model):
             The value to store.
         """
         obj = self._get_data_store()
-        obj[key] = value
-        self._set_data_store(obj)
+        # Store a JSON round-tripped copy, so unserializable values fail here and later changes to value aren't stored
+        obj[key] = json.loads(json.dumps(value))
+        self._data_store_changed()
         return True # NOTE: Why does this line exist?
 
     def remove(self, key):
@@ -407,7 +449,7 @@ class DataStore(models.Model):
         """
         obj = self._get_data_store()
         res = obj.pop(key, None)
-        self._set_data_store(obj)
+        self._data_store_changed()
         if not res:
             return False
         return True
@@ -428,17 +470,86 @@ class LogAPICall(models.Model):
     # JSON blob of the request payload, which is used for matching the incoming event with recent requests.
     extra_info = models.TextField()
 
+    class Meta:
+        indexes = [
+            # For clean_up_api_calls. Matching goes through LogAPICallMatch.
+            models.Index(fields=["proposal_time"], name="logapicall_proposal_time_idx"),
+        ]
+
     def __str__(self):
         return f"LogAPICall {self.call_type} ({self.pk})"
 
     @classmethod
     def make_api_call(cls, community, values, call, action=None, method=None):
-        LogAPICall.objects.create(
-            community=community,
-            call_type=call,
-            extra_info=json.dumps(values)
+        LogAPICall.log_call(community, values, call)
+        with profiler.platform_call():
+            return community.make_call(call, values=values, action=action, method=method)
+
+    @classmethod
+    def log_call(cls, community, values, call):
+        """
+        Record an API call without making it. Each top-level value in the payload is stored as a match key,
+        in the cache and in the database, so ``is_recent_call`` can find it without scanning recent calls.
+
+        :meta private:
+        """
+        log = LogAPICall.objects.create(community=community, call_type=call, extra_info=json.dumps(values))
+
+        # Generic method calls (like slack.method) can be matched by their method name too
+        call_types = {call}
+        if isinstance(values.get("method_name"), str):
+            call_types.add(values["method_name"])
+
+        keys = {
+            LogAPICall._match_key(community.pk, call_type, key, value)
+            for call_type in call_types
+            for (key, value) in values.items()
+            if isinstance(value, (str, int, float, bool))
+        }
+        LogAPICallMatch.objects.bulk_create(
+            [LogAPICallMatch(log=log, key=key, call_time=log.proposal_time) for key in keys]
         )
-        return community.make_call(call, values=values, action=action, method=method)
+        cache.set_many({key: log.proposal_time for key in keys}, timeout=settings.LOG_API_CALL_MATCH_TTL)
+        return log
+
+    @classmethod
+    def is_recent_call(cls, community, call_type, key, value, seconds):
+        """
+        Returns True if PolicyKit made a ``call_type`` call for this community in the last ``seconds`` seconds, with
+        ``value`` as the value of ``key`` in its payload. Used to ignore events caused by PolicyKit's own calls.
+        ``seconds`` should be no more than ``LOG_API_CALL_MATCH_TTL``.
+
+        :meta private:
+        """
+        match_key = LogAPICall._match_key(community.pk, call_type, key, value)
+        since = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+
+        call_time = cache.get(match_key)
+        if call_time is not None and call_time >= since:
+            return True
+        # Not in this cache, or only an older call is (the cache may be per-process, or the entry was evicted),
+        # so a recent call made by another process can only be found in the database
+        return LogAPICallMatch.objects.filter(key=match_key, call_time__gte=since).exists()
+
+    @staticmethod
+    def _match_key(community_id, call_type, key, value):
+        match = json.dumps([community_id, call_type, key, value])
+        return "policyengine:api_call:" + hashlib.sha1(match.encode()).hexdigest()
+
+class LogAPICallMatch(models.Model):
+    """
+    Hashed (community, call type, key, value) key of a LogAPICall, used to look up calls by payload value.
+
+    :meta private:
+    """
+    log = models.ForeignKey(LogAPICall, models.CASCADE, related_name="match_keys")
+    key = models.CharField(max_length=64)
+    call_time = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["key", "call_time"], name="logapicallmatch_key_time_idx"),
+        ]
 
 class Proposal(models.Model):
     """The Proposal model represents the evaluation of a particular policy for a particular action.
@@ -474,9 +585,39 @@ class Proposal(models.Model):
     governance_process = models.ForeignKey(GovernanceProcess, on_delete=models.SET_NULL, blank=True, null=True)
     """The Metagov GovernanceProcess that is being used to make a decision about this Proposal, if any."""
 
+    next_evaluation_at = models.DateTimeField(blank=True, null=True)
+    """Datetime before which this pending proposal is skipped by the periodic evaluation. If empty, it is evaluated every time."""
+
+    vote_tally = models.JSONField(blank=True, null=True, editable=False)
+    """Vote counts in the format returned by ``get_vote_summary``, kept up to date by the vote receivers. Empty if it needs to be recounted."""
+
+    claimed_until = models.DateTimeField(blank=True, null=True, editable=False)
+    """Datetime until which a worker has claimed this pending proposal for evaluation, see ``tasks.evaluate_proposals``."""
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_evaluation_at"], name="proposal_status_next_eval_idx"),
+        ]
+
     def __str__(self):
         return f"Proposal {self.pk}: {self.action} : {self.policy or 'POLICY_DELETED'} ({self.status})"
 
+    def recheck_in(self, seconds=0, minutes=0, hours=0, days=0):
+        """
+        Skip this proposal in the periodic evaluation until the given amount of time has passed.
+        Use this in the check step when the outcome can't change until a known time, like the end of a vote.
+        New votes on the proposal cause it to be evaluated earlier.
+
+        Parameters
+        -------
+        seconds, minutes, hours, days
+            How long to wait before evaluating the proposal again.
+        """
+        delay = timedelta(seconds=seconds, minutes=minutes, hours=hours, days=days)
+        self.next_evaluation_at = datetime.now(timezone.utc) + delay
+        if self.pk:
+            Proposal.objects.filter(pk=self.pk).update(next_evaluation_at=self.next_evaluation_at)
+
     @property
     def vote_url(self):
         """
@@ -501,6 +642,159 @@ class Proposal(models.Model):
         """
         return datetime.now(timezone.utc) - self.proposal_time
 
+    def get_vote_summary(self, users=None):
+        """
+        Returns the number of votes for each value, as a dictionary with the keys ``"yes"`` and ``"no"`` (boolean votes), ``"choices"`` (choice votes, by value) and ``"numbers"`` (number votes, by value).
+        Uses at most one query, so prefer it over counting several vote QuerySets. Can specify a subset of users to count votes of. If no subset is specified, then votes from all users will be counted.
+
+        Example: ``{"yes": 3, "no": 1, "choices": {"consent": 2}, "numbers": {5: 1}}``
+        """
+        if not users and self.vote_tally is not None:
+            return Proposal._parse_vote_tally(self.vote_tally)
+        return self._count_votes(users)
+
+    def sync_votes(self, user_votes, community, user_model, user_fields=None, create_users=True):
+        """
+        Brings the votes on this proposal in line with a full vote outcome from Metagov, and refreshes ``vote_tally``.
+        Existing users and votes are loaded with one query each, new votes are created with one bulk insert and changed
+        votes are saved with one bulk update, all in a single transaction. Returns True if any vote was created or changed.
+
+        Parameters
+        -------
+        user_votes
+            Dictionary mapping each vote value to the platform user ids that voted for it. Use True and False as the values
+            for boolean votes, and the option names for choice votes.
+        community
+            The CommunityPlatform the voters belong to.
+        user_model
+            The CommunityUser subclass for the platform.
+        user_fields
+            Function returning the fields of the user for a platform user id, used to find and create users. Must include
+            ``username``. Defaults to using the platform user id as the username.
+        create_users
+            Whether to create users that don't exist yet. If False, their votes are ignored.
+
+        :meta private:
+        """
+        user_fields = user_fields or (lambda user_id: {"username": user_id})
+        is_boolean_vote = all(isinstance(value, bool) for value in user_votes)
+        vote_model, value_field = (BooleanVote, "boolean_value") if is_boolean_vote else (ChoiceVote, "value")
+
+        # If a user shows up under several values, the last one counts
+        fields_by_username = {}
+        value_by_username = {}
+        for value, user_ids in user_votes.items():
+            for user_id in user_ids:
+                fields = user_fields(user_id)
+                fields_by_username[fields["username"]] = fields
+                value_by_username[fields["username"]] = value
+
+        with transaction.atomic():
+            users = {
+                user.username: user
+                for user in user_model.objects.filter(community=community, username__in=fields_by_username.keys())
+            }
+            # CommunityUsers use multi-table inheritance, so they can't be bulk created
+            for username in (fields_by_username.keys() - users.keys()) if create_users else []:
+                fields = dict(fields_by_username[username])
+                del fields["username"]
+                users[username], _ = user_model.objects.get_or_create(
+                    username=username, community=community, defaults=fields
+                )
+
+            existing_votes = {
+                vote.user_id: vote
+                for vote in vote_model.objects.filter(proposal=self, user__in=[user.pk for user in users.values()])
+            }
+            new_votes = []
+            changed_votes = []
+            for username, value in value_by_username.items():
+                user = users.get(username)
+                if user is None:
+                    continue
+                vote = existing_votes.get(user.pk)
+                if vote is None:
+                    new_votes.append(vote_model(proposal=self, user=user, **{value_field: value}))
+                elif getattr(vote, value_field) != value:
+                    setattr(vote, value_field, value)
+                    changed_votes.append(vote)
+
+            if new_votes:
+                vote_model.objects.bulk_create(new_votes)
+            if changed_votes:
+                vote_model.objects.bulk_update(changed_votes, [value_field])
+
+            votes_changed = bool(new_votes or changed_votes)
+            if votes_changed or self.vote_tally is None:
+                self.refresh_vote_tally()
+            # Bulk queries don't send the vote signals, so clear the recheck time like invalidate_vote_tally does
+            if votes_changed:
+                self.next_evaluation_at = None
+                Proposal.objects.filter(pk=self.pk, next_evaluation_at__isnull=False).update(next_evaluation_at=None)
+
+        if votes_changed:
+            logger.debug(f"Counted {len(new_votes)} new and {len(changed_votes)} changed votes for proposal {self.pk}")
+        return votes_changed
+
+    def refresh_vote_tally(self):
+        """
+        Recounts the votes on this proposal and stores the result in ``vote_tally``. Called by the vote receivers after they change votes.
+
+        :meta private:
+        """
+        with transaction.atomic():
+            # Lock the proposal so concurrent vote updates store their tallies one after the other
+            Proposal.objects.select_for_update().filter(pk=self.pk).values_list("pk").first()
+            summary = self._count_votes()
+            self.vote_tally = {
+                "yes": summary["yes"],
+                "no": summary["no"],
+                "choices": summary["choices"],
+                # JSON object keys are strings
+                "numbers": {str(value): count for value, count in summary["numbers"].items()},
+            }
+            Proposal.objects.filter(pk=self.pk).update(vote_tally=self.vote_tally)
+        return summary
+
+    def _count_votes(self, users=None):
+        def counts(model, value_field, kind):
+            votes = model.objects.filter(proposal=self)
+            if users:
+                votes = votes.filter(user__in=users)
+            return (
+                votes.order_by()
+                .annotate(kind=Value(kind, output_field=CharField()), vote_value=Cast(value_field, CharField()))
+                .values("kind", "vote_value")
+                .annotate(count=Count("pk"))
+            )
+
+        rows = counts(BooleanVote, "boolean_value", "boolean").union(
+            counts(ChoiceVote, "value", "choice"), counts(NumberVote, "number_value", "number"), all=True
+        )
+
+        summary = {"yes": 0, "no": 0, "choices": {}, "numbers": {}}
+        for row in rows:
+            value = row["vote_value"]
+            if value is None:
+                continue
+            if row["kind"] == "boolean":
+                # Booleans are cast to "1"/"0" or "true"/"false" depending on the database
+                summary["yes" if value.lower() in ("1", "t", "true") else "no"] += row["count"]
+            elif row["kind"] == "choice":
+                summary["choices"][value] = summary["choices"].get(value, 0) + row["count"]
+            else:
+                summary["numbers"][int(value)] = summary["numbers"].get(int(value), 0) + row["count"]
+        return summary
+
+    @staticmethod
+    def _parse_vote_tally(vote_tally):
+        return {
+            "yes": vote_tally.get("yes", 0),
+            "no": vote_tally.get("no", 0),
+            "choices": dict(vote_tally.get("choices", {})),
+            "numbers": {int(value): count for value, count in vote_tally.get("numbers", {}).items()},
+        }
+
     def get_all_boolean_votes(self, users=None):
         """
         For Boolean voting. Returns all boolean votes as a QuerySet. Can specify a subset of users to count votes of. If no subset is specified, then votes from all users will be counted.
@@ -556,6 +850,22 @@ class Proposal(models.Model):
             self.data = DataStore.objects.create()
         super(Proposal, self).save(*args, **kwargs)
 
+    def _save_evaluation(self):
+        """
+        Saves the proposal after an evaluation. If it already exists, every field is written except the ones that
+        are only changed with update(), so a vote tally stored or a recheck time cleared during the evaluation isn't
+        overwritten.
+
+        :meta private:
+        """
+        if self.pk is None:
+            self.save()
+            return
+        excluded = ("vote_tally", "claimed_until", "next_evaluation_at")
+        self.save(update_fields=[
+            f.name for f in self._meta.concrete_fields if not f.primary_key and f.name not in excluded
+        ])
+
     def _pass_evaluation(self):
         """
         Sets the proposal to PASSED.
@@ -563,7 +873,7 @@ class Proposal(models.Model):
         :meta private:
         """
         self.status = Proposal.PASSED
-        self.save()
+        self._save_evaluation()
         action = self.action
         actstream_action.send(action, verb='was passed', community_id=action.community.id, action_codename=action.action_type)
         if self.governance_process:
@@ -579,7 +889,7 @@ class Proposal(models.Model):
         :meta private:
         """
         self.status = Proposal.FAILED
-        self.save()
+        self._save_evaluation()
         action = self.action
         actstream_action.send(action, verb='was failed', community_id=action.community.id, action_codename=action.action_type)
         if self.governance_process:
@@ -889,6 +1199,12 @@ class Policy(models.Model):
     modified_at = models.DateTimeField(auto_now=True)
     """Datetime object representing the last time the policy was modified."""
 
+    budget_exceeded_count = models.PositiveIntegerField(default=0, editable=False)
+    """Number of times a step of the policy was stopped for running too long, too many steps, or returning too much."""
+
+    budget_exceeded_at = models.DateTimeField(blank=True, null=True, editable=False)
+    """Datetime object representing the last time a step of the policy was stopped for exceeding its budget."""
+
     # TODO(https://github.com/amyxzhang/policykit/issues/341) add back support for policy bundles
     bundled_policies = models.ManyToManyField("self", blank=True, symmetrical=False, related_name="member_of_bundle")
     """Policies bundled inside this policy."""
@@ -1388,6 +1704,116 @@ class Procedure(models.Model):
             "fail": self.loads("fail"),
         }
 
+class PolicyStepStats(models.Model):
+    """
+    Execution statistics of one step of a policy, for one minute. Written by ``policyengine.profiler``.
+
+    :meta private:
+    """
+    policy = models.ForeignKey(Policy, models.CASCADE)
+    step = models.CharField(max_length=30)
+    """Name of the step, or 'evaluation' for whole evaluations."""
+    bucket = models.DateTimeField()
+    """Start of the minute that the statistics are for."""
+    count = models.PositiveIntegerField(default=0)
+    total_time = models.FloatField(default=0)
+    max_time = models.FloatField(default=0)
+    total_queries = models.PositiveIntegerField(default=0)
+    max_queries = models.PositiveIntegerField(default=0)
+    total_platform_calls = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [["policy", "step", "bucket"]]
+        indexes = [
+            models.Index(fields=["bucket"], name="policystepstats_bucket_idx"),
+        ]
+
+    @classmethod
+    def add_stats(cls, stats):
+        """
+        Add statistics to the table. ``stats`` maps (policy pk, step, bucket) to
+        [count, total_time, max_time, total_queries, max_queries, total_platform_calls].
+        """
+        from django.db import IntegrityError
+        from django.db.models import F
+        from django.db.models.functions import Greatest
+
+        existing_policy_ids = set(
+            Policy.objects.filter(pk__in={policy_id for (policy_id, _, _) in stats}).values_list("pk", flat=True)
+        )
+        for (policy_id, step, bucket), (count, total_time, max_time, total_queries, max_queries, calls) in stats.items():
+            if policy_id not in existing_policy_ids:
+                # The policy was deleted
+                continue
+            rows = cls.objects.filter(policy_id=policy_id, step=step, bucket=bucket)
+            update = dict(
+                count=F("count") + count,
+                total_time=F("total_time") + total_time,
+                max_time=Greatest("max_time", Value(max_time)),
+                total_queries=F("total_queries") + total_queries,
+                max_queries=Greatest("max_queries", Value(max_queries)),
+                total_platform_calls=F("total_platform_calls") + calls,
+            )
+            if rows.update(**update):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        policy_id=policy_id, step=step, bucket=bucket, count=count, total_time=total_time,
+                        max_time=max_time, total_queries=total_queries, max_queries=max_queries,
+                        total_platform_calls=calls,
+                    )
+            except IntegrityError:
+                # Another process created the row first
+                rows.update(**update)
+
+    @classmethod
+    def summarize(cls, since, community=None):
+        """
+        Totals per policy and step since the given datetime, most expensive first, as a list of dicts
+        with the policy and step, and count, total_time, avg_time, max_time, queries, max_queries and platform_calls.
+        """
+        from django.db.models import Max, Sum
+
+        stats = cls.objects.filter(bucket__gte=since)
+        if community is not None:
+            stats = stats.filter(policy__community=community)
+        rows = list(
+            stats.values("policy_id", "policy__name", "step")
+            .annotate(
+                count=Sum("count"),
+                total_time=Sum("total_time"),
+                max_time=Max("max_time"),
+                queries=Sum("total_queries"),
+                max_queries=Max("max_queries"),
+                platform_calls=Sum("total_platform_calls"),
+            )
+            .order_by("-total_time")
+        )
+        for row in rows:
+            row["avg_time"] = row["total_time"] / row["count"] if row["count"] else 0
+        return rows
+
+
+class ActivityCommunity(models.Model):
+    """
+    The Community of an activity stream entry, so the dashboard can list a community's recent activity
+    from an index. Activity entries only store the CommunityPlatform pk in their JSON data.
+    Created by the ``add_activity_community`` receiver.
+
+    :meta private:
+    """
+    action = models.OneToOneField("actstream.Action", models.CASCADE, primary_key=True, related_name="policykit_community")
+    community = models.ForeignKey(Community, models.CASCADE)
+    timestamp = models.DateTimeField()
+    """Copy of the activity's timestamp, so the index covers the ordering."""
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["community", "-timestamp"], name="activitycommunity_recent_idx"),
+        ]
+
+
 class PolicyTemplate(models.Model):
 
     JSON_FIELDS = ["extra_executions", "variables", "data"]
@@ -1673,6 +2099,120 @@ def post_delete_community(sender, instance, **kwargs):
     if instance.metagov_slug:
         metagov.get_community(instance.metagov_slug).delete()
 
+@receiver(post_save, sender=Policy)
+@receiver(post_delete, sender=Policy)
+def invalidate_policy_compiled_code(sender, instance, **kwargs):
+    # Drop this process's compiled steps for the Policy. Other processes never reuse stale code,
+    # because the cache key includes a hash of the step code.
+    engine.compiled_code_cache.invalidate_policy(instance.pk)
+
+@receiver(post_save, sender=Policy)
+@receiver(post_delete, sender=Policy)
+def invalidate_policy_index(sender, instance, **kwargs):
+    if instance.community_id:
+        engine.invalidate_policy_index(instance.community_id)
+
+@receiver(m2m_changed, sender=Policy.action_types.through)
+def invalidate_policy_index_action_types(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # An ActionType's policies were changed
+        community_ids = Policy.objects.filter(pk__in=pk_set or []).values_list("community_id", flat=True).distinct()
+    else:
+        community_ids = [instance.community_id]
+    for community_id in community_ids:
+        if community_id:
+            engine.invalidate_policy_index(community_id)
+
+@receiver(post_save, sender=Community)
+def invalidate_new_community_policy_index(sender, instance, created, **kwargs):
+    # Drop any index left over under this pk (for example from a community that was rolled back)
+    if created:
+        engine.invalidate_policy_index(instance.pk)
+        Utils.invalidate_autocompletes(instance.pk)
+        invalidate_dashboard_summary(instance.pk)
+
+def invalidate_community_platforms(sender, instance, **kwargs):
+    # Connected in policyEngineConfig.ready for CommunityPlatform and each of its subclasses,
+    # because signals are sent with the concrete class as sender
+    engine.invalidate_community_platforms(instance.community_id)
+    Utils.invalidate_autocompletes(instance.community_id)
+
+@receiver(post_save, sender=BooleanVote)
+@receiver(post_save, sender=ChoiceVote)
+@receiver(post_save, sender=NumberVote)
+@receiver(post_delete, sender=BooleanVote)
+@receiver(post_delete, sender=ChoiceVote)
+@receiver(post_delete, sender=NumberVote)
+def invalidate_vote_tally(sender, instance, **kwargs):
+    # Votes changed outside of the vote receivers, so the stored tally has to be recounted. The proposal is
+    # also evaluated in the next sweep, even if its check step asked to be rechecked later.
+    Proposal.objects.filter(pk=instance.proposal_id).exclude(vote_tally=None, next_evaluation_at=None).update(
+        vote_tally=None, next_evaluation_at=None
+    )
+
+@receiver(post_save, sender="actstream.Action")
+def add_activity_community(sender, instance, created, **kwargs):
+    # Index the activity by Community, for the dashboard's action log
+    community_platform_id = (instance.data or {}).get("community_id") if created else None
+    if not community_platform_id:
+        return
+    community_id = CommunityPlatform.objects.filter(pk=community_platform_id).values_list("community_id", flat=True).first()
+    if community_id:
+        ActivityCommunity.objects.create(action=instance, community_id=community_id, timestamp=instance.timestamp)
+        invalidate_dashboard_summary(community_id)
+
+@receiver(post_save, sender=CommunityRole)
+@receiver(post_delete, sender=CommunityRole)
+@receiver(post_save, sender=CommunityDoc)
+@receiver(post_delete, sender=CommunityDoc)
+@receiver(post_save, sender=Policy)
+@receiver(post_delete, sender=Policy)
+def invalidate_community_dashboard(sender, instance, **kwargs):
+    if instance.community_id:
+        invalidate_dashboard_summary(instance.community_id)
+
+@receiver(post_save, sender=PolicyVariable)
+@receiver(post_delete, sender=PolicyVariable)
+@receiver(post_save, sender=Proposal)
+@receiver(post_delete, sender=Proposal)
+def invalidate_policy_dashboard(sender, instance, created=False, **kwargs):
+    if sender is Proposal and kwargs.get("signal") is post_save and not created and instance.status == Proposal.PROPOSED:
+        # Pending proposals are saved on every evaluation, but the dashboard only lists them
+        return
+    community_id = Policy.objects.filter(pk=instance.policy_id).values_list("community_id", flat=True).first()
+    if community_id:
+        invalidate_dashboard_summary(community_id)
+
+@receiver(m2m_changed, sender=Policy.action_types.through)
+def invalidate_dashboard_action_types(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        community_ids = Policy.objects.filter(pk__in=pk_set or []).values_list("community_id", flat=True).distinct()
+    else:
+        community_ids = [instance.community_id]
+    for community_id in community_ids:
+        if community_id:
+            invalidate_dashboard_summary(community_id)
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_dashboard_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # Users were added to or removed from a role
+        community_ids = CommunityRole.objects.filter(pk=instance.pk).values_list("community_id", flat=True)
+    else:
+        # Roles were added to or removed from a user. For post_clear pk_set is None, so use the user's platform.
+        community_ids = CommunityUser.objects.non_polymorphic().filter(pk=instance.pk).values_list(
+            "community__community_id", flat=True
+        )
+    for community_id in community_ids:
+        if community_id:
+            invalidate_dashboard_summary(community_id)
+
 @receiver(post_delete, sender=CommunityPlatform)
 def post_delete_community_platform(sender, instance, **kwargs):
     # After deleting a CommunityPlatform, delete the Metagov Plugin associated with it (if any)
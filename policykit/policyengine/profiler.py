@@ -0,0 +1,126 @@
+"""
+Lightweight profiler for policy evaluation.
+
+Records the wall time, number of database queries and number of outbound platform calls of each policy step,
+aggregated in memory per (policy, step, minute) and periodically written to ``PolicyStepStats``.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class _Counters:
+    __slots__ = ("queries", "platform_calls")
+
+    def __init__(self):
+        self.queries = 0
+        self.platform_calls = 0
+
+
+class StepProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (policy pk, step name, minute) -> [count, total_time, max_time, total_queries, max_queries, total_platform_calls]
+        self._stats = {}
+        self._last_flush = time.monotonic()
+
+    @property
+    def _active(self):
+        if not hasattr(self._local, "active"):
+            self._local.active = []
+        return self._local.active
+
+    @contextmanager
+    def profile(self, policy, step_name):
+        """Measure the code run inside the block, and record it for the policy and step."""
+        from django.conf import settings
+        from django.db import connection
+
+        if not settings.POLICY_PROFILER_ENABLED or not policy or not policy.pk:
+            yield
+            return
+
+        counters = _Counters()
+
+        def count_query(execute, sql, params, many, context):
+            counters.queries += 1
+            return execute(sql, params, many, context)
+
+        active = self._active
+        active.append(counters)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            active.remove(counters)
+            self._record(policy.pk, step_name, elapsed, counters.queries, counters.platform_calls)
+
+    def count_platform_call(self):
+        """Count an outbound platform call for every step being profiled on this thread."""
+        if getattr(self._local, "in_platform_call", False):
+            # Already counted by the enclosing platform_call block
+            return
+        for counters in getattr(self._local, "active", ()):
+            counters.platform_calls += 1
+
+    @contextmanager
+    def platform_call(self):
+        """Count the block as one outbound platform call, however many calls it counts itself."""
+        if getattr(self._local, "in_platform_call", False):
+            yield
+            return
+        self.count_platform_call()
+        self._local.in_platform_call = True
+        try:
+            yield
+        finally:
+            self._local.in_platform_call = False
+
+    def _record(self, policy_id, step_name, elapsed, queries, platform_calls):
+        minute = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        key = (policy_id, step_name, minute)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                self._stats[key] = [1, elapsed, elapsed, queries, queries, platform_calls]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+                stats[3] += queries
+                stats[4] = max(stats[4], queries)
+                stats[5] += platform_calls
+
+    def flush(self, force=True):
+        """
+        Add the statistics collected so far to the PolicyStepStats table. If ``force`` is False, only flush
+        if POLICY_PROFILER_FLUSH_INTERVAL seconds have passed since the last flush.
+        """
+        from django.conf import settings
+
+        if not force and time.monotonic() - self._last_flush < settings.POLICY_PROFILER_FLUSH_INTERVAL:
+            return
+
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            self._last_flush = time.monotonic()
+        if not stats:
+            return
+
+        from policyengine.models import PolicyStepStats
+
+        try:
+            PolicyStepStats.add_stats(stats)
+        except Exception:
+            # Statistics are best effort, never break evaluation over them
+            logger.exception(f"Failed to write statistics for {len(stats)} policy steps")
+
+
+profiler = StepProfiler()
@@ -4,6 +4,11 @@ from RestrictedPython.Eval import default_guarded_getitem, default_guarded_getit
 from RestrictedPython.Guards import safer_getattr, guarded_unpack_sequence, guarded_iter_unpack_sequence
 
 
+import ast
+import sys
+import time
+from types import MappingProxyType
+
 # permitted modules
 import datetime
 import base64
@@ -29,12 +34,39 @@ STATIC_GLOBAL_VARIABLES = {
 }
 
 
+def _budget_check_statement(location):
+    """``_budget_check_()`` as a statement, at the position of the given node"""
+    call = ast.Call(func=ast.Name(id="_budget_check_", ctx=ast.Load()), args=[], keywords=[])
+    return ast.fix_missing_locations(ast.copy_location(ast.Expr(value=call), location))
+
+
 class OwnRestrictingNodeTransformer(RestrictingNodeTransformer):
     def visit_Import(self, node):
         raise SyntaxError("Import statements are not allowed.", ("<user_code>", node.lineno, node.col_offset, ""))
 
     visit_ImportFrom = visit_Import
 
+    # Python removes the trace function that enforces the ExecutionBudget when it raises, so once user code
+    # catches an ExecutionBudgetExceeded, nothing would stop it anymore. Every place where user code can
+    # swallow an exception (except and finally blocks, and with statements) first calls _budget_check_,
+    # which raises again if the budget was exceeded. The calls are added after visiting, because user code
+    # itself isn't allowed to use names starting with an underscore.
+
+    def visit_ExceptHandler(self, node):
+        node = super().visit_ExceptHandler(node)
+        node.body.insert(0, _budget_check_statement(node.body[0]))
+        return node
+
+    def visit_Try(self, node):
+        node = super().visit_Try(node)
+        if node.finalbody:
+            node.finalbody.insert(0, _budget_check_statement(node.finalbody[0]))
+        return node
+
+    def visit_With(self, node):
+        node = super().visit_With(node)
+        return [node, _budget_check_statement(node)]
+
 
 def _hook_writable(obj):
     """Only allow writing to lists and dicts."""
@@ -57,65 +89,225 @@ def _guarded_import(mname, globals=None, locals=None, fromlist=None, level=None)
     raise SyntaxError(f"Restricted, cannot import '{mname}'")
 
 
-def execute_user_code(user_code: str, user_func: str, *args, **kwargs):
+def compile_user_code(user_code: str, user_func: str):
     """
-    Execute user code in restricted env using RestrictedPython
-    Adapted from https://memoryline.github.io/python/django/security/2020/08/01/how-can-i-accept-and-run-users-code-securely.html
+    Compile user code with RestrictedPython, appending a line that calls @user_func.
+    The returned code object can be cached and passed to ``execute_compiled_code`` any number of times.
 
     Args:
         user_code(str) - String containing the unsafe code
         user_func(str) - Function inside user_code to execute and return value
-        *args, **kwargs - arguments passed to the user function
     Return:
-        Return value of the user_func
+        Restricted code object
+    Raises:
+        SyntaxError if the code does not compile, or uses a disallowed construct
     """
+    # Add another line to user code that executes @user_func
+    user_code += "\nresult = {0}(*args, **kwargs)".format(user_func)
 
-    def _apply(f, *a, **kw):
-        return f(*a, **kw)
+    return compile_restricted(user_code, filename="<user_code>", mode="exec", policy=OwnRestrictingNodeTransformer)
 
+
+# (type, attribute name) pairs that passed safer_getattr's checks. Its checks in RestrictedPython 5.2 (pinned
+# in requirements.txt) only depend on the type of the object and the name, so later lookups of the same pair
+# can skip them. Classes are never cached, because every class has the same type. Denied lookups aren't
+# cached either, so they always go through safer_getattr and raise exactly the same errors.
+_getattr_allowed = {}
+_GETATTR_ALLOWED_MAX_SIZE = 10000
+
+
+def _cached_safer_getattr(object, name, default=None, getattr=getattr):
+    """Same as safer_getattr, but remembers which attributes of each type are allowed."""
+    if isinstance(object, type):
+        return safer_getattr(object, name, default, getattr)
     try:
-        # This is the variables we allow user code to see. @result will contain return value.
-        restricted_locals = {
-            "result": None,
-            "args": args,
-            "kwargs": kwargs,
-        }
-
-        restricted_globals = {
-            "__builtins__": {
-                **policykit_builtins,
-                # special case guard to fix strftime bug
-                "__import__": _guarded_import,
-            },
-            "_getitem_": default_guarded_getitem,
-            "_getiter_": default_guarded_getiter,
-            "_unpack_sequence_": guarded_unpack_sequence,
-            "_iter_unpack_sequence_": guarded_iter_unpack_sequence,
-            "_getattr_": safer_getattr,
-            "_inplacevar_": lambda op, val, expr: val + expr,  # permit +=
-            "_write_": _hook_writable,
-            # to access args and kwargs
-            "_apply_": _apply,
-            **STATIC_GLOBAL_VARIABLES,
-        }
-
-        # Add another line to user code that executes @user_func
-        user_code += "\nresult = {0}(*args, **kwargs)".format(user_func)
-
-        # Compile the user code
-        byte_code = compile_restricted(
-            user_code, filename="<user_code>", mode="exec", policy=OwnRestrictingNodeTransformer
-        )
+        key = (type(object), name)
+        allowed = key in _getattr_allowed
+    except TypeError:
+        # unhashable name
+        return safer_getattr(object, name, default, getattr)
+
+    if allowed:
+        return getattr(object, name, default)
+
+    value = safer_getattr(object, name, default, getattr)
+    if len(_getattr_allowed) < _GETATTR_ALLOWED_MAX_SIZE:
+        _getattr_allowed[key] = True
+    return value
+
+
+def _apply(f, *a, **kw):
+    return f(*a, **kw)
+
+
+# These are the globals we allow user code to see. They are built once, and copied for each execution
+# (top-level definitions in the user code are stored in the copy).
+BASE_RESTRICTED_GLOBALS = MappingProxyType(
+    {
+        # a plain dict, because exec only uses the fast lookup path for dict builtins
+        "__builtins__": {
+            **policykit_builtins,
+            # special case guard to fix strftime bug
+            "__import__": _guarded_import,
+        },
+        "_getitem_": default_guarded_getitem,
+        "_getiter_": default_guarded_getiter,
+        "_unpack_sequence_": guarded_unpack_sequence,
+        "_iter_unpack_sequence_": guarded_iter_unpack_sequence,
+        "_getattr_": _cached_safer_getattr,
+        "_inplacevar_": lambda op, val, expr: val + expr,  # permit +=
+        "_write_": _hook_writable,
+        # to access args and kwargs
+        "_apply_": _apply,
+        # replaced by ExecutionBudget.check_exceeded when running with a budget
+        "_budget_check_": lambda: None,
+        **STATIC_GLOBAL_VARIABLES,
+    }
+)
+
+
+class ExecutionBudgetExceeded(Exception):
+    """Raised when user code exceeds the limits of its ``ExecutionBudget``"""
+
+    pass
+
+
+class ExecutionBudget:
+    """
+    Limits for one execution of user code. Any limit can be None to disable it.
+
+    Args:
+        timeout(float) - Wall-clock seconds the code may run for. It's checked before each line of user code
+            and when the code returns, so a single blocking call is only stopped once it returns.
+        max_steps(int) - Number of lines of user code that may be executed.
+        max_result_size(int) - Maximum len() of a returned string, bytes or collection.
+
+    The timeout and step limit are enforced with sys.settrace. Besides each line of user code, the trace function
+    is called for every Python function call made from user code, including ORM and platform client code.
+    Measured on CPython 3.11, that costs about 0.2µs per line of user code and 0.6µs per Python call, which makes
+    pure-Python calls around 8 times slower. This is why both limits are off unless they are configured.
+    """
 
+    def __init__(self, timeout=None, max_steps=None, max_result_size=None):
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.max_result_size = max_result_size
+        self.steps = 0
+        self.deadline = None
+        self.exceeded = None
+
+    @property
+    def needs_trace(self):
+        return self.timeout is not None or self.max_steps is not None
+
+    def start(self):
+        self.steps = 0
+        self.exceeded = None
+        if self.timeout is not None:
+            self.deadline = time.monotonic() + self.timeout
+
+    def _exceed(self, message):
+        # Remember the first violation, so it's raised even if the user code catches the exception
+        if self.exceeded is None:
+            self.exceeded = message
+        raise ExecutionBudgetExceeded(self.exceeded)
+
+    def _trace_calls(self, frame, event, arg):
+        # Only trace lines in user code, so calls into PolicyKit and platform code run at full speed
+        if frame.f_code.co_filename != "<user_code>":
+            return None
+        return self._trace_lines
+
+    def _trace_lines(self, frame, event, arg):
+        if event == "line":
+            self.steps += 1
+            if self.max_steps is not None and self.steps > self.max_steps:
+                self._exceed(f"Exceeded the limit of {self.max_steps} steps")
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                self._exceed(f"Exceeded the time limit of {self.timeout} seconds")
+        return self._trace_lines
+
+    def check_exceeded(self):
+        """Raise ExecutionBudgetExceeded if a limit was broken. Called from user code, see OwnRestrictingNodeTransformer."""
+        if self.exceeded is not None:
+            raise ExecutionBudgetExceeded(self.exceeded)
+
+    def check(self, result):
+        """Raise ExecutionBudgetExceeded if the finished execution broke any limit."""
+        if self.exceeded is not None:
+            raise ExecutionBudgetExceeded(self.exceeded)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self._exceed(f"Exceeded the time limit of {self.timeout} seconds")
+        if (
+            self.max_result_size is not None
+            and isinstance(result, (str, bytes, list, tuple, dict, set, frozenset))
+            and len(result) > self.max_result_size
+        ):
+            self._exceed(f"Returned a result of size {len(result)}, the limit is {self.max_result_size}")
+
+
+def execute_compiled_code(byte_code, *args, budget=None, **kwargs):
+    """
+    Execute restricted code previously compiled by ``compile_user_code``.
+
+    Args:
+        byte_code - Code object returned by ``compile_user_code``
+        *args, **kwargs - arguments passed to the user function
+        budget(ExecutionBudget) - optional limits for this execution
+    Return:
+        Return value of the user function
+    Raises:
+        ExecutionBudgetExceeded if the execution broke a limit of the budget
+    """
+    # This is the variables we allow user code to see. @result will contain return value.
+    restricted_locals = {
+        "result": None,
+        "args": args,
+        "kwargs": kwargs,
+    }
+
+    restricted_globals = dict(BASE_RESTRICTED_GLOBALS)
+
+    if budget is None:
         # Run it
         exec(byte_code, restricted_globals, restricted_locals)
+    else:
+        budget.start()
+        restricted_globals["_budget_check_"] = budget.check_exceeded
+        previous_trace = sys.gettrace()
+        if budget.needs_trace:
+            sys.settrace(budget._trace_calls)
+        try:
+            # Run it
+            exec(byte_code, restricted_globals, restricted_locals)
+        except Exception:
+            # The user code may have turned the violation into a different exception
+            if budget.exceeded is not None:
+                raise ExecutionBudgetExceeded(budget.exceeded)
+            raise
+        finally:
+            if budget.needs_trace:
+                sys.settrace(previous_trace)
+        budget.check(restricted_locals["result"])
+
+    # User code has modified result inside restricted_locals. Return it.
+    return restricted_locals["result"]
+
+
+def execute_user_code(user_code: str, user_func: str, *args, **kwargs):
+    """
+    Execute user code in restricted env using RestrictedPython
+    Adapted from https://memoryline.github.io/python/django/security/2020/08/01/how-can-i-accept-and-run-users-code-securely.html
 
-        # User code has modified result inside restricted_locals. Return it.
-        return restricted_locals["result"]
+    Args:
+        user_code(str) - String containing the unsafe code
+        user_func(str) - Function inside user_code to execute and return value
+        *args, **kwargs - arguments passed to the user function
+    Return:
+        Return value of the user_func
+    """
+    # Compile the user code. Raises SyntaxError for code that does not compile.
+    byte_code = compile_user_code(user_code, user_func)
 
-    except SyntaxError as e:
-        # Code that does not compile
-        raise
-    except Exception as e:
-        # The code did something that is not allowed
-        raise
\ No newline at end of file
+    # Run it. Raises whatever the code did that is not allowed.
+    return execute_compiled_code(byte_code, *args, **kwargs)
@@ -10,46 +10,266 @@ logger = logging.getLogger(__name__)
 @shared_task
 def evaluate_pending_proposals():
     """
-    Iterates through all pending Proposals and re-evaluates them.
+    Dispatches subtasks that re-evaluate all pending Proposals, see ``get_pending_proposal_chunks``.
+    """
+    from celery import group
+
+    subtasks = [evaluate_proposals.s(proposal_pks) for proposal_pks in get_pending_proposal_chunks()]
+    if subtasks:
+        group(subtasks).apply_async()
+
+
+def get_pending_proposal_chunks(community_ids=None):
+    """
+    Get the pks of the pending Proposals that are due for evaluation, as a list of chunks that can each be
+    evaluated by one ``evaluate_proposals`` subtask. If ``community_ids`` is given, only proposals of those
+    communities are included.
+
+    Pending proposals are sharded by community, and large communities are split into chunks of
+    PENDING_PROPOSALS_CHUNK_SIZE, so several workers can share a sweep and one slow community
+    doesn't hold up the rest.
+    """
+    from django.conf import settings
+    from django.db.models import Q
+    from django.utils import timezone
+
+    from policyengine.models import Proposal
+
+    # Skip proposals that asked not to be checked again until later, see Proposal.recheck_in
+    is_due = Q(next_evaluation_at__isnull=True) | Q(next_evaluation_at__lte=timezone.now())
+    pending = Proposal.objects.filter(is_due, status=Proposal.PROPOSED)
+    if community_ids is not None:
+        pending = pending.filter(action__community__community_id__in=community_ids)
+    pending = pending.order_by("action__community__community_id", "pk").values_list(
+        "action__community__community_id", "pk"
+    )
+
+    proposals_by_community = {}
+    for community_id, proposal_pk in pending:
+        proposals_by_community.setdefault(community_id, []).append(proposal_pk)
+
+    chunk_size = settings.PENDING_PROPOSALS_CHUNK_SIZE
+    return [
+        proposal_pks[i : i + chunk_size]
+        for proposal_pks in proposals_by_community.values()
+        for i in range(0, len(proposal_pks), chunk_size)
+    ]
+
+
+@shared_task
+def evaluate_proposals(proposal_pks):
+    """
+    Re-evaluates the given pending Proposals, whether or not they are due.
+
+    Each proposal is claimed with a lease of PROPOSAL_CLAIM_TIMEOUT seconds before it is evaluated, so a
+    proposal is never evaluated twice concurrently. Proposals that are claimed by another worker or no
+    longer pending are skipped. The claim is committed on its own: evaluation calls out to platforms and
+    executes actions, so it doesn't run in a transaction that could roll back its status afterwards.
+
+    Returns the pks of the pending proposals that were skipped because another worker had claimed them.
+    """
+    from datetime import timedelta
+
+    from django.conf import settings
+    from django.db.models import Q
+    from django.utils import timezone
+
+    from policyengine.models import Proposal
+
+    claimed_elsewhere = []
+    for proposal_pk in proposal_pks:
+        now = timezone.now()
+        claimed = (
+            Proposal.objects.filter(pk=proposal_pk, status=Proposal.PROPOSED)
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lte=now))
+            .update(claimed_until=now + timedelta(seconds=settings.PROPOSAL_CLAIM_TIMEOUT))
+        )
+        if not claimed:
+            if Proposal.objects.filter(pk=proposal_pk, status=Proposal.PROPOSED).exists():
+                claimed_elsewhere.append(proposal_pk)
+            continue
+        try:
+            proposal = Proposal.objects.filter(pk=proposal_pk).first()
+            if proposal:
+                evaluate_pending_proposal(proposal)
+        finally:
+            Proposal.objects.filter(pk=proposal_pk).update(claimed_until=None)
+    return claimed_elsewhere
+
+
+def _reevaluation_cache_key(proposal_pk):
+    return f"policyengine:reevaluate_proposal:{proposal_pk}"
+
+
+def schedule_proposal_reevaluation(proposal):
+    """
+    Re-evaluate a pending Proposal soon, without waiting for the next sweep. Called when a vote is cast.
+    Also clears the proposal's ``next_evaluation_at``, so the sweep no longer skips it.
+
+    Calls within PROPOSAL_REEVALUATION_DELAY seconds of each other are coalesced into one evaluation
+    that runs at the end of that window, so a burst of votes only costs one evaluation.
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.db import transaction
+
+    from policyengine.models import Proposal
+
+    if proposal.next_evaluation_at:
+        proposal.next_evaluation_at = None
+        Proposal.objects.filter(pk=proposal.pk).update(next_evaluation_at=None)
+
+    delay = settings.PROPOSAL_REEVALUATION_DELAY
+    # cache.add only succeeds if there isn't already an evaluation scheduled for this proposal
+    if not cache.add(_reevaluation_cache_key(proposal.pk), True, timeout=delay * 2):
+        return
+
+    # Wait for the votes to be committed before evaluating
+    transaction.on_commit(lambda: reevaluate_proposal.apply_async((proposal.pk,), countdown=delay))
+
+
+@shared_task
+def reevaluate_proposal(proposal_pk, attempt=0):
+    """
+    Re-evaluates one pending Proposal that was scheduled by ``schedule_proposal_reevaluation``.
+
+    If another worker is evaluating the proposal, it may not have seen the new votes, so the evaluation is
+    tried again with a doubling delay, up to PROPOSAL_REEVALUATION_RETRIES times. After that the proposal
+    is left to the periodic sweep.
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+
+    # Let votes cast from now on schedule another evaluation
+    key = _reevaluation_cache_key(proposal_pk)
+    cache.delete(key)
+    if not evaluate_proposals([proposal_pk]) or attempt >= settings.PROPOSAL_REEVALUATION_RETRIES:
+        return
+
+    countdown = settings.PROPOSAL_REEVALUATION_DELAY * 2 ** (attempt + 1)
+    # If a vote cast in the meantime already scheduled an evaluation, that one covers this retry
+    if cache.add(key, True, timeout=countdown * 2):
+        reevaluate_proposal.apply_async((proposal_pk, attempt + 1), countdown=countdown)
+
+
+def evaluate_pending_proposal(proposal):
+    """
+    Re-evaluates one pending Proposal.
     """
     # import PK modules inside the task so we get code updates.
     from policyengine import engine
     from policyengine.models import Proposal, ExecutedActionTriggerAction, GovernableAction
 
+    community_name = proposal.action.community.community_name
+    logger.debug(f"{community_name} - Evaluating proposal '{proposal}'")
+    try:
+        engine.evaluate_proposal(proposal)
+    except (engine.PolicyDoesNotExist, engine.PolicyIsNotActive, engine.PolicyDoesNotPassFilter) as e:
+        logger.warn(f"{community_name} - ERROR - {type(e).__name__} deleting proposal: {proposal}")
+        new_proposal = engine.delete_and_rerun(proposal)
+        logger.debug(f"{community_name} - New proposal: {new_proposal}")
+    except Exception as e:
+        logger.error(f"{community_name} - Error running proposal {proposal}: {repr(e)} {e}")
 
-    pending_proposals = Proposal.objects.filter(status=Proposal.PROPOSED)
-    #logger.debug("Running evaluate_pending_proposals:" + str(len(pending_proposals)))
-
-    for proposal in pending_proposals:
-        community_name = proposal.action.community.community_name
-        logger.debug(f"{community_name} - Evaluating proposal '{proposal}'")
-        try:
-            engine.evaluate_proposal(proposal)
-        except (engine.PolicyDoesNotExist, engine.PolicyIsNotActive, engine.PolicyDoesNotPassFilter) as e:
-            logger.warn(f"{community_name} - ERROR - {type(e).__name__} deleting proposal: {proposal}")
-            new_proposal = engine.delete_and_rerun(proposal)
-            logger.debug(f"{community_name} - New proposal: {new_proposal}")
-        except Exception as e:
-            logger.error(f"{community_name} - Error running proposal {proposal}: {repr(e)} {e}")
-            
-            
-        # If the engine just PASSED a GovernableAction, generate a new Trigger for the newly executed action.
-        # This lets us use GovernableActions as triggers for trigger policies.
-        if proposal.status == Proposal.PASSED and isinstance(proposal.action, GovernableAction):
-            ExecutedActionTriggerAction.from_action(proposal.action).evaluate()
-
-    clean_up_logs()
-    # logger.debug("finished task")
+    # If the engine just PASSED a GovernableAction, generate a new Trigger for the newly executed action.
+    # This lets us use GovernableActions as triggers for trigger policies.
+    if proposal.status == Proposal.PASSED and isinstance(proposal.action, GovernableAction):
+        ExecutedActionTriggerAction.from_action(proposal.action).evaluate()
 
 
+@shared_task
 def clean_up_logs():
+    """
+    Deletes old EvaluationLogs. Keeps at most DB_MAX_LOGS_TO_KEEP logs overall and DB_MAX_LOGS_TO_KEEP_PER_COMMUNITY
+    logs per community, and deletes logs older than DB_MAX_LOG_AGE_DAYS. Also deletes PolicyStepStats older than
+    POLICY_STEP_STATS_MAX_AGE_DAYS.
+
+    Logs are inserted in pk order, so each limit is turned into a pk watermark (found by walking the pk index
+    at most as far as the number of logs to keep) and everything below it is deleted in chunks.
+    """
+    from datetime import timedelta
+
+    from django.conf import settings
+    from django.utils import timezone
+
     from django_db_logger.models import EvaluationLog
-    from policykit.settings import DB_MAX_LOGS_TO_KEEP
+    from policyengine.models import Community, PolicyStepStats
 
-    expired_logs = EvaluationLog.objects.filter(
-        pk__in=EvaluationLog.objects.all().order_by("-create_datetime").values_list("pk")[DB_MAX_LOGS_TO_KEEP:]
-    )
+    stats_cutoff = timezone.now() - timedelta(days=settings.POLICY_STEP_STATS_MAX_AGE_DAYS)
+    PolicyStepStats.objects.filter(bucket__lt=stats_cutoff).delete()
+
+    logs = EvaluationLog.objects.all()
+
+    # Age-based retention: the first log that is recent enough is the watermark
+    cutoff = timezone.now() - timedelta(days=settings.DB_MAX_LOG_AGE_DAYS)
+    first_recent_pk = logs.filter(create_datetime__gte=cutoff).order_by("pk").values_list("pk", flat=True).first()
+    _delete_logs_below(logs, first_recent_pk)
+
+    # Global quota
+    _delete_logs_below(logs, _nth_newest_log_pk(logs, settings.DB_MAX_LOGS_TO_KEEP))
+
+    # Per-community quotas
+    for community_id in Community.objects.values_list("pk", flat=True):
+        community_logs = logs.filter(community_id=community_id)
+        _delete_logs_below(
+            community_logs, _nth_newest_log_pk(community_logs, settings.DB_MAX_LOGS_TO_KEEP_PER_COMMUNITY)
+        )
+
+
+@shared_task
+def clean_up_api_calls():
+    """
+    Deletes LogAPICalls (and their match keys) older than LOG_API_CALL_MATCH_TTL. Older calls can no longer
+    match an incoming event, so keeping them would only grow the table.
+    """
+    from datetime import timedelta
+
+    from django.conf import settings
+    from django.utils import timezone
+
+    from policyengine.models import LogAPICall
+
+    calls = LogAPICall.objects.all()
+    cutoff = timezone.now() - timedelta(seconds=settings.LOG_API_CALL_MATCH_TTL)
+    first_recent_pk = calls.filter(proposal_time__gte=cutoff).order_by("pk").values_list("pk", flat=True).first()
+    _delete_logs_below(calls, first_recent_pk)
+
+
+@shared_task(ignore_result=False)
+def deep_lint_check(code, function_name):
+    """
+    Runs pylint on policy code from the editor. The errors are stored in the celery result backend,
+    where ``linter.get_deep_lint_errors`` reads them. Results are ignored by default, so this task opts in.
+    """
+    from policyengine import linter
+
+    return linter._pylint_check(code, function_name)
+
+
+def _nth_newest_log_pk(logs, n):
+    """
+    Returns the pk of the n-th newest log (counting from 1), or 0 if there are n logs or fewer.
+    """
+    pk = logs.order_by("-pk").values_list("pk", flat=True)[n - 1 : n].first()
+    return pk or 0
+
+
+def _delete_logs_below(logs, watermark):
+    """
+    Deletes logs (or other rows) with a pk lower than the watermark, in chunks of DB_LOG_DELETE_CHUNK_SIZE.
+    A watermark of 0 deletes nothing, and a watermark of None deletes all the logs.
+    """
+    from django.conf import settings
+
+    if watermark == 0:
+        return
+    expired_logs = logs if watermark is None else logs.filter(pk__lt=watermark)
+    chunk_size = settings.DB_LOG_DELETE_CHUNK_SIZE
 
-    if expired_logs.exists():
-        # logger.debug(f"Deleting {expired_logs.count()} EvaluationLogs")
-        expired_logs.delete()
+    while True:
+        chunk = list(expired_logs.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not chunk:
+            return
+        expired_logs.filter(pk__gte=chunk[0], pk__lte=chunk[-1]).delete()
+        if len(chunk) < chunk_size:
+            return
@@ -12,13 +12,15 @@ def cut(value, arg):
 @register.filter(name="user_roles")
 def user_roles(value):
     """List all roles for a given user"""
-    return list(value.groups.all().values_list("communityrole__role_name", flat=True))
+    # Iterate over groups.all(), so groups prefetched with their communityrole don't cost a query
+    return [group.communityrole.role_name for group in value.groups.all() if hasattr(group, "communityrole")]
 
 
 @register.filter(name="role_users_string")
 def role_users_string(value):
     """List users in role"""
-    num = value.user_set.count()
+    # Use the num_users annotation and prefetched user_set, if the role was loaded with them
+    num = value.num_users if hasattr(value, "num_users") else value.user_set.count()
     users = value.user_set.all()[0:3]
     display_names = [u.communityuser.readable_name or u.username for u in users]
     return comma_separated(display_names, num)
@@ -27,21 +29,19 @@ def role_users_string(value):
 @register.filter(name="action_types")
 def action_types(value):
     """List action types on policy"""
-    if not value.action_types.exists():
+    display_names = [action_type.codename for action_type in value.action_types.all()]
+    if not display_names:
         return None
-    num = value.action_types.count()
-    display_names = value.action_types.all()[0:3].values_list("codename", flat=True)
-    return comma_separated(display_names, num)
+    return comma_separated(display_names, len(display_names))
 
 
 @register.filter(name="variables")
 def variables(value):
     """List variables on policy"""
-    if not value.variables.exists():
+    display_variables = [f"{variable.name}:{variable.value}" for variable in value.variables.all()]
+    if not display_variables:
         return None
-    num = value.variables.count()
-    display_variables = [f"{variable['name']}:{variable['value']}" for variable in value.variables.all().values()]
-    return comma_separated(display_variables, num)
+    return comma_separated(display_variables, len(display_variables))
 
 
 def comma_separated(display_names, num):
@@ -40,48 +40,27 @@ def find_action_cls(codename: str, app_name=None):
     """
     Get the BaseAction subclass that has the specified codename
     """
-    from policyengine.models import BaseAction
+    from policyengine.action_registry import action_registry
 
-    if app_name:
-        all_models = list(apps.get_app_config(app_name).get_models())
-    else:
-        listoflists = [
-            list(a.get_models())
-            for a in list(apps.get_app_configs())
-            if "constitution" in a.name or "integration" in a.name
-        ]
-        all_models = [item for sublist in listoflists for item in sublist]
-
-    for cls in all_models:
-        if issubclass(cls, BaseAction) and cls._meta.model_name == codename:
-            return cls
-    return None
+    return action_registry.find_action_cls(codename, app_name)
 
 
 def get_action_classes(app_name: str):
     """
     Get a list of GovernableAction subclasses defined in the given app
     """
-    from policyengine.models import GovernableAction
+    from policyengine.action_registry import action_registry
 
-    actions = []
-    for cls in apps.get_app_config(app_name).get_models():
-        if issubclass(cls, GovernableAction):
-            actions.append(cls)
-    return actions
+    return action_registry.get_action_classes(app_name)
 
 
 def get_trigger_classes(app_name: str):
     """
     Get a list of TriggerAction subclasses defined in the given app
     """
-    from policyengine.models import TriggerAction
+    from policyengine.action_registry import action_registry
 
-    actions = []
-    for cls in apps.get_app_config(app_name).get_models():
-        if issubclass(cls, TriggerAction):
-            actions.append(cls)
-    return actions
+    return action_registry.get_trigger_classes(app_name)
 
 
 def get_action_types(community, kinds):
@@ -118,37 +97,86 @@ def get_action_types(community, kinds):
 
 
 def get_autocompletes(community, action_types=None, policy=None):
+    """
+    Get the sorted list of autocomplete strings for editing a policy of the community
+    that governs the given action types.
+    """
     import policyengine.autocomplete as PkAutocomplete
 
-    platform_communities = list(community.get_platform_communities())
-    platform_communities_keys = [p.platform for p in platform_communities]
-
-    # Add general autocompletes (proposal, policy, logger, and common fields on action)
-    autocompletes = PkAutocomplete.general_autocompletes.copy()
+    autocompletes, _ = get_autocompletes_and_etag(community, action_types)
 
     # Add autocompletes for policy's variable
     if policy:
+        variable_hints = []
         for variable in policy.variables.all() or []:
-            variable_hint = PkAutocomplete.generate_variable_autocompletes(variable)
-            autocompletes.extend(variable_hint)
+            variable_hints.extend(PkAutocomplete.generate_variable_autocompletes(variable))
+        if variable_hints:
+            autocompletes = sorted(set(autocompletes).union(variable_hints))
+    return autocompletes
+
+
+def get_autocompletes_and_etag(community, action_types=None):
+    """
+    Get the sorted list of autocomplete strings for the community and action types, and an ETag for the list.
+    Lists are cached per community and set of action types, until ``invalidate_autocompletes`` is called for
+    the community (when its platforms change).
+    """
+    import hashlib
+
+    import policyengine.autocomplete as PkAutocomplete
+    from django.conf import settings
+    from django.core.cache import cache
+
+    action_types = sorted(set(action_types or []))
+    key = "policyengine:autocompletes:{}:{}:{}:{}".format(
+        community.pk,
+        cache.get(_autocompletes_version_key(community.pk), 0),
+        PkAutocomplete.get_autocompletes_version(),
+        hashlib.sha1(",".join(action_types).encode("utf-8")).hexdigest(),
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    platform_communities_keys = [p.platform for p in community.get_platform_communities()]
+
+    # Add general autocompletes (proposal, policy, logger, and common fields on action)
+    autocompletes = set(PkAutocomplete.get_general_autocompletes())
 
     # Add autocompletes for each platform that this community is connected to
-    for k, v in PkAutocomplete.integration_autocompletes.items():
+    for k, v in PkAutocomplete.get_integration_autocompletes().items():
         if k in platform_communities_keys:
-            autocompletes.extend(v)
-            autocompletes.append(k)
+            autocompletes.update(v)
+            autocompletes.add(k)
 
     # Add autocompletes for the selected action(s)
-    for codename in action_types or []:
-        cls = find_action_cls(codename)
-        if cls:
-            hints = PkAutocomplete.generate_action_autocompletes(cls)
-            autocompletes.extend(hints)
-
-    # remove duplicates (for example 'action.channel' would be repeated if SlackPostMessage and SlackRenameChannel selected)
-    autocompletes = list(set(autocompletes))
-    autocompletes.sort()
-    return autocompletes
+    for codename in action_types:
+        autocompletes.update(PkAutocomplete.get_action_autocompletes(codename))
+
+    # sorting a set also removes duplicates (for example 'action.channel' would be repeated if SlackPostMessage
+    # and SlackRenameChannel selected)
+    autocompletes = sorted(autocompletes)
+    etag = '"%s"' % hashlib.sha1(json.dumps(autocompletes).encode("utf-8")).hexdigest()
+    cache.set(key, (autocompletes, etag), settings.AUTOCOMPLETES_CACHE_TIMEOUT)
+    return autocompletes, etag
+
+
+def _autocompletes_version_key(community_id):
+    return f"policyengine:autocompletes_version:{community_id}"
+
+
+def invalidate_autocompletes(community_id):
+    """Forget the cached autocompletes for a community. Called when a CommunityPlatform is saved or deleted."""
+    from django.core.cache import cache
+
+    key = _autocompletes_version_key(community_id)
+    # add only succeeds if there isn't a version yet
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The version was evicted in the meantime
+            cache.set(key, 1, None)
 
 
 def get_platform_integrations():
@@ -357,8 +385,6 @@ def get_filter_parameters(app_name, action_codename):
     """
         Get the designated filter parameters for a GovernableAction
     """
-    action_model = apps.get_model(app_name, action_codename)
-    if hasattr(action_model, "FILTER_PARAMETERS"):
-        return action_model.FILTER_PARAMETERS
-    else:
-        return []
\ No newline at end of file
+    from policyengine.action_registry import action_registry
+
+    return action_registry.get_filter_parameters(app_name, action_codename)
\ No newline at end of file
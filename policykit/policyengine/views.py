@@ -3,7 +3,6 @@ import json
 import logging
 import os
 
-from actstream.models import Action
 from django.conf import settings
 from django.contrib.auth import authenticate, get_user, login
 from django.contrib.auth.decorators import login_required, permission_required
@@ -13,18 +12,16 @@ from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
                          JsonResponse)
 from django.http.response import HttpResponseServerError
 from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 import policyengine.utils as Utils
 from policyengine.integration_data import integration_data
-from policyengine.linter import _lint_check
+from policyengine.linter import _lint_check, get_deep_lint_errors
 from policyengine.metagov_app import metagov, metagov_handler
 from policyengine.utils import INTEGRATION_ADMIN_ROLE_NAME
 
 logger = logging.getLogger(__name__)
 
-DASHBOARD_MAX_USERS = 50
-DASHBOARD_MAX_ACTIONS = 20
-
 
 def homepage(request):
     """PolicyKit splash page"""
@@ -104,33 +101,13 @@ def initialize_starterkit(request):
 
 @login_required
 def dashboard(request):
-    from policyengine.models import CommunityPlatform, CommunityUser, Proposal
+    from policyengine.dashboard import get_dashboard_summary
     user = get_user(request)
     community = user.community.community
 
-    # List all CommunityUsers across all platforms connected to this community
-    users = CommunityUser.objects.filter(community__community=community)[:DASHBOARD_MAX_USERS]
-
-    # List recent actions across all CommunityPlatforms connected to this community
-    platform_communities = CommunityPlatform.objects.filter(community=community)
-    action_log = Action.objects.filter(data__community_id__in=[cp.pk for cp in platform_communities])[:DASHBOARD_MAX_ACTIONS]
-
-    # List pending proposals for all Policies connected to this community
-    pending_proposals = Proposal.objects.filter(
-        policy__community=community,
-        status=Proposal.PROPOSED
-    ).order_by("-proposal_time")
-
     return render(request, 'policyadmin/dashboard/index.html', {
         'user': user,
-        'users': users,
-        'roles': community.get_roles(),
-        'docs': community.get_documents(),
-        'platform_policies': community.get_platform_policies(),
-        'constitution_policies': community.get_constitution_policies(),
-        'trigger_policies': community.get_trigger_policies(),
-        'action_log': action_log,
-        'pending_proposals': pending_proposals
+        **get_dashboard_summary(community),
     })
 
 
@@ -305,6 +282,30 @@ def editor(request):
 
     return render(request, 'policyadmin/dashboard/editor.html', data)
 
+@login_required
+def policystats(request):
+    """
+    Execution statistics of the community's policies, per step, over the last ``minutes`` minutes (default 60).
+    """
+    from datetime import timedelta
+
+    from django.utils import timezone
+    from policyengine.models import PolicyStepStats
+
+    user = get_user(request)
+    try:
+        minutes = max(1, int(request.GET.get('minutes', 60)))
+    except ValueError:
+        return HttpResponseBadRequest("minutes must be a number")
+
+    stats = PolicyStepStats.summarize(timezone.now() - timedelta(minutes=minutes), community=user.community.community)
+
+    return render(request, 'policyadmin/dashboard/policystats.html', {
+        'user': user,
+        'stats': stats,
+        'minutes': minutes
+    })
+
 @login_required
 def selectrole(request):
     from policyengine.models import CommunityRole
@@ -503,21 +504,37 @@ def get_autocompletes(request):
     action_types = request.GET.get("action_types").split(",")
     if not action_types or len(action_types) == 1 and not action_types[0]:
         action_types = None
-    autocompletes = Utils.get_autocompletes(community, action_types=action_types)
-    return JsonResponse({'autocompletes': autocompletes})
+    autocompletes, etag = Utils.get_autocompletes_and_etag(community, action_types=action_types)
+
+    # The editor asks again whenever the action types change, so let the browser revalidate its copy
+    not_modified = get_conditional_response(request, etag=etag)
+    response = not_modified or JsonResponse({'autocompletes': autocompletes})
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required
 def error_check(request):
     """
     Takes a request object containing Python code data. Calls _lint_check(code)
     to check provided Python code for errors.
+    If 'deep' is true, pylint errors are added once pylint has checked the code in the background,
+    and 'deep_pending' is true until then.
     Returns a JSON response containing the output and errors from linting.
     """
     data = json.loads(request.body)
     code = data['code']
     function_name = data['function_name']
     errors = _lint_check(code, function_name)
-    return JsonResponse({'errors': errors})
+    response = {'errors': errors}
+
+    if data.get('deep') and not errors:
+        deep_errors = get_deep_lint_errors(code, function_name)
+        if deep_errors is None:
+            response['deep_pending'] = True
+        else:
+            response['errors'] = deep_errors
+    return JsonResponse(response)
 
 @login_required
 def policy_action_save(request):
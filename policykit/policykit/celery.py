@@ -3,6 +3,7 @@ from __future__ import absolute_import, unicode_literals
 import os
 
 from celery import Celery
+from celery.signals import task_postrun
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'policykit.settings')
@@ -24,6 +25,20 @@ app.autodiscover_tasks()
 # Don't store task results in the database
 app.conf.task_ignore_result = True
 
+@task_postrun.connect
+def flush_database_logs(**kwargs):
+    # Write any evaluation logs still buffered by the task
+    from django_db_logger.db_log_handler import flush_database_logs
+
+    flush_database_logs()
+
+@task_postrun.connect
+def flush_policy_profiler(**kwargs):
+    # Write the policy step statistics collected by the task
+    from policyengine.profiler import profiler
+
+    profiler.flush(force=False)
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
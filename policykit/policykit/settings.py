@@ -164,6 +164,35 @@ DATABASES = {
 }
 
 
+# Caches
+# Use a shared backend (such as redis or memcached) in production by setting CACHE_URL,
+# so that caches like the policy index stay coherent between web and celery processes.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Seconds to keep each community's index of active policies in the cache. Only policy pks are cached, so with
+# a per-process cache, policies added in another process can be missed for up to this long. Names in policy
+# code that aren't platforms of the community are also remembered for this long.
+POLICY_INDEX_CACHE_TIMEOUT = env.int('POLICY_INDEX_CACHE_TIMEOUT', default=60)
+
+# Seconds to keep each community's editor autocompletes in the cache
+AUTOCOMPLETES_CACHE_TIMEOUT = 3600
+
+# Seconds to keep each community's dashboard summary in the cache. It is also dropped when the community's
+# roles, documents, policies or proposals change, so this mostly bounds how stale the user list can get.
+DASHBOARD_CACHE_TIMEOUT = 30
+
+# Seconds to remember outgoing API calls, for recognizing events that PolicyKit caused itself
+LOG_API_CALL_MATCH_TTL = 120
+
+# Seconds to cache the errors found in policy code by the editor's linter, and seconds to wait for a pylint run
+# (the optional deep check) before starting another one for the same code
+POLICY_LINT_CACHE_TIMEOUT = 3600
+POLICY_LINT_DEEP_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -239,6 +268,12 @@ loggers['metagov'] = {'handlers': ['console', 'file'], 'level': "DEBUG", "propag
 
 # Maximum number of log records to keep
 DB_MAX_LOGS_TO_KEEP = 5000
+# Maximum number of log records to keep for each community
+DB_MAX_LOGS_TO_KEEP_PER_COMMUNITY = 1000
+# Log records older than this are deleted
+DB_MAX_LOG_AGE_DAYS = 30
+# Number of log records deleted per query when cleaning up logs
+DB_LOG_DELETE_CHUNK_SIZE = 1000
 
 LOGGING = {
     'version': 1,
@@ -249,7 +284,9 @@ LOGGING = {
     },
     'handlers': {
         "db_log": {
-            'class': 'django_db_logger.db_log_handler.DatabaseLogHandler'
+            'class': 'django_db_logger.db_log_handler.DatabaseLogHandler',
+            # Maximum number of log records to buffer before writing them to the database
+            'capacity': 100,
         },
         "file": {
             "class": "logging.FileHandler",
@@ -267,12 +304,60 @@ CELERY_CACHE_BACKEND = 'django-cache'
 
 CELERY_BEAT_FREQUENCY = 60.0
 
+# Run tasks (and the subtasks they dispatch) synchronously when testing
+CELERY_TASK_ALWAYS_EAGER = TESTING
+
+# Limits for running each policy step: wall-clock seconds, lines of policy code executed, and len() of the
+# returned value. None disables a limit. The timeout and step limit trace policy code while it runs, which slows
+# down every Python call made from it (see ExecutionBudget), so they are opt-in.
+POLICY_STEP_TIMEOUT = env.float('POLICY_STEP_TIMEOUT', default=None)
+POLICY_STEP_MAX_STEPS = None
+POLICY_STEP_MAX_RESULT_SIZE = 100000
+
+# Per-step timing statistics (PolicyStepStats). Statistics are kept in memory and written at most every
+# POLICY_PROFILER_FLUSH_INTERVAL seconds, and deleted after POLICY_STEP_STATS_MAX_AGE_DAYS.
+POLICY_PROFILER_ENABLED = env.bool('POLICY_PROFILER_ENABLED', default=True)
+POLICY_PROFILER_FLUSH_INTERVAL = 10
+POLICY_STEP_STATS_MAX_AGE_DAYS = 7
+
+# Maximum number of pending proposals evaluated by one subtask of evaluate_pending_proposals
+PENDING_PROPOSALS_CHUNK_SIZE = 100
+
+# Seconds that a worker holds its claim on a pending proposal, so other workers don't evaluate it at the same time.
+# Should be longer than any evaluation takes. A claim left by a worker that died expires after this long.
+PROPOSAL_CLAIM_TIMEOUT = 300
+
+# Seconds to wait for more votes before re-evaluating a proposal that just received a vote
+PROPOSAL_REEVALUATION_DELAY = 1.0
+
+# Times to retry that evaluation, with a doubling delay, while another worker is evaluating the proposal
+PROPOSAL_REEVALUATION_RETRIES = 5
+
+# Polling Discourse: number of concurrent requests, seconds to wait for a response, and retries for failed requests
+DISCOURSE_LISTENER_CONCURRENCY = 8
+DISCOURSE_HTTP_TIMEOUT = 10.0
+DISCOURSE_HTTP_RETRIES = 3
+
+# Polling Reddit: number of concurrent requests for vote comments, and seconds to wait for a response
+REDDIT_LISTENER_CONCURRENCY = 8
+REDDIT_HTTP_TIMEOUT = 10.0
+
 CELERY_BEAT_SCHEDULE = {
     # Evaluate pending policy evaluations every minute
     "evaluate-pending-proposals-beat": {
         "task": "policyengine.tasks.evaluate_pending_proposals",
         "schedule": CELERY_BEAT_FREQUENCY,
     },
+    # Delete old evaluation logs every hour
+    "clean-up-logs-beat": {
+        "task": "policyengine.tasks.clean_up_logs",
+        "schedule": 60 * 60,
+    },
+    # Delete API call records that are too old to match incoming events every 10 minutes
+    "clean-up-api-calls-beat": {
+        "task": "policyengine.tasks.clean_up_api_calls",
+        "schedule": 60 * 10,
+    },
     # Poll reddit for updates
     "reddit-listener-beat": {
         "task": "integrations.reddit.tasks.reddit_listener_actions",
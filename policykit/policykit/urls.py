@@ -48,6 +48,7 @@ urlpatterns = [
     path('main/settings/', policyviews.settings_page, name="settings"),
     path('main/settings/addintegration', policyviews.add_integration, name="add_integration"),
     path('main/logs/', include('django_db_logger.urls', namespace='django_db_logger')),
+    path('main/policystats/', policyviews.policystats, name="policystats"),
 
     # COLLECTIVE VOICE
     path('collectivevoice/home', policyviews.collectivevoice_home),
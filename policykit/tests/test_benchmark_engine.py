@@ -0,0 +1,27 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from policyengine.models import Community, Policy
+
+
+class BenchmarkEngineTests(TestCase):
+    def test_benchmark_engine(self):
+        """The benchmark reports throughput as JSON, and leaves nothing behind"""
+        out = StringIO()
+        call_command(
+            "benchmark_engine", communities=2, users=5, roles=2, actions=4, pending=3, sweeps=2, stdout=out
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertEqual(results["evaluate_action"]["actions"], 8)
+        self.assertGreater(results["evaluate_action"]["actions_per_second"], 0)
+        self.assertGreater(results["evaluate_action"]["queries"], 0)
+        self.assertEqual(len(results["sweeps"]), 2)
+        # the pending proposals, and any actions that were just proposed
+        self.assertGreaterEqual(results["sweeps"][0]["proposals"], 6)
+        self.assertIn("Vote on renaming Slack channels", results["policies"])
+
+        self.assertFalse(Community.objects.exists())
+        self.assertFalse(Policy.objects.exists())
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_db_logger.models import EvaluationLog
+from policyengine.models import LogAPICall, LogAPICallMatch
+from policyengine.tasks import clean_up_api_calls, clean_up_logs
+
+import tests.utils as TestUtils
+
+
+@override_settings(
+    DB_MAX_LOGS_TO_KEEP=6, DB_MAX_LOGS_TO_KEEP_PER_COMMUNITY=3, DB_MAX_LOG_AGE_DAYS=30, DB_LOG_DELETE_CHUNK_SIZE=2
+)
+class CleanUpLogsTests(TestCase):
+    def setUp(self):
+        self.community = TestUtils.create_slack_community_and_user()[0].community
+        self.other_community = TestUtils.create_slack_community_and_user(team_id="DEF", username="user2")[0].community
+
+    def create_logs(self, community, count):
+        return [EvaluationLog.objects.create(community=community, msg=f"log {i}") for i in range(count)]
+
+    def test_per_community_quota(self):
+        """Each community keeps its newest logs"""
+        logs = self.create_logs(self.community, 5)
+        other_logs = self.create_logs(self.other_community, 2)
+        clean_up_logs()
+        self.assertEqual(
+            list(EvaluationLog.objects.filter(community=self.community).order_by("pk")), logs[2:]
+        )
+        self.assertEqual(
+            list(EvaluationLog.objects.filter(community=self.other_community).order_by("pk")), other_logs
+        )
+
+    def test_global_quota(self):
+        """At most DB_MAX_LOGS_TO_KEEP logs are kept"""
+        self.create_logs(None, 9)
+        clean_up_logs()
+        self.assertEqual(EvaluationLog.objects.count(), 6)
+
+    def test_max_age(self):
+        """Logs older than DB_MAX_LOG_AGE_DAYS are deleted"""
+        old_logs = self.create_logs(self.community, 2)
+        EvaluationLog.objects.filter(pk__in=[log.pk for log in old_logs]).update(
+            create_datetime=timezone.now() - timedelta(days=31)
+        )
+        new_logs = self.create_logs(self.community, 1)
+        clean_up_logs()
+        self.assertEqual(list(EvaluationLog.objects.order_by("pk")), new_logs)
+
+
+@override_settings(LOG_API_CALL_MATCH_TTL=120, DB_LOG_DELETE_CHUNK_SIZE=2)
+class CleanUpAPICallsTests(TestCase):
+    def test_max_age(self):
+        """API calls too old to match incoming events are deleted with their match keys"""
+        slack_community = TestUtils.create_slack_community_and_user()[0]
+        old_calls = [LogAPICall.log_call(slack_community, {"text": f"old {i}"}, "chat.postMessage") for i in range(3)]
+        LogAPICall.objects.filter(pk__in=[call.pk for call in old_calls]).update(
+            proposal_time=timezone.now() - timedelta(minutes=5)
+        )
+        new_call = LogAPICall.log_call(slack_community, {"text": "new"}, "chat.postMessage")
+        clean_up_api_calls()
+        self.assertEqual(list(LogAPICall.objects.all()), [new_call])
+        self.assertEqual(LogAPICallMatch.objects.count(), 1)
@@ -0,0 +1,178 @@
+import datetime
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, override_settings
+from integrations.discourse.models import DiscourseCommunity, DiscourseCreateTopic
+import integrations.discourse.tasks as DiscourseTasks
+from integrations.discourse.tasks import discourse_listener_actions
+from policyengine.models import Policy
+
+import tests.utils as TestUtils
+
+
+class FakeDiscourse:
+    """Local HTTP server that answers like a Discourse forum, for a fixed set of paths"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests.append(self.path)
+                status, body = fake.responses.get(self.path, (404, {}))
+                payload = json.dumps(body).encode()
+                etag = '"%s"' % hashlib.sha1(payload).hexdigest()
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def latest_topics(*topics):
+    return {
+        "topic_list": {
+            "topics": [
+                {
+                    "id": topic_id,
+                    "title": f"topic {topic_id}",
+                    "category_id": 1,
+                    "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+                    "posters": [{"user_id": 7}],
+                }
+                for (topic_id, created_at) in topics
+            ]
+        },
+        "users": [{"id": 7, "username": "alice"}],
+    }
+
+
+@override_settings(DISCOURSE_HTTP_RETRIES=0, DISCOURSE_HTTP_TIMEOUT=5.0)
+class DiscourseListenerTests(TestCase):
+    def setUp(self):
+        # Build a new session with the overridden settings
+        DiscourseTasks._http_session = None
+        now = datetime.datetime.now()
+        self.forum = FakeDiscourse(
+            {
+                "/latest.json": (200, latest_topics((1, now), (2, now - datetime.timedelta(days=1)))),
+                "/t/1/posts.json?include_raw=True": (200, {"post_stream": {"posts": [{"raw": "hello"}]}}),
+            }
+        )
+        self.broken_forum = FakeDiscourse({"/latest.json": (500, {})})
+        self.addCleanup(self.forum.close)
+        self.addCleanup(self.broken_forum.close)
+
+        self.community = DiscourseCommunity.objects.create(
+            community_name="discourse test community", team_id=self.forum.url, api_key="key1"
+        )
+        DiscourseCommunity.objects.create(
+            community_name="broken discourse community", team_id=self.broken_forum.url, api_key="key2"
+        )
+        Policy.objects.create(**TestUtils.ALL_ACTIONS_PASS, kind=Policy.PLATFORM, community=self.community.community)
+
+    def test_new_topics(self):
+        """New topics become actions, even when another forum fails"""
+        discourse_listener_actions()
+
+        topic = DiscourseCreateTopic.objects.get()
+        self.assertEqual((topic.topic_id, topic.raw, topic.initiator.username), (1, "hello", "alice"))
+        self.assertEqual(topic.community.pk, self.community.pk)
+        self.assertIn("/latest.json", self.broken_forum.requests)
+        # only the new topic's post is fetched
+        self.assertNotIn("/t/2/posts.json?include_raw=True", self.forum.requests)
+
+    def test_cursor(self):
+        """Later polls pick up topics above the cursor, and skip topic lists that haven't changed"""
+        discourse_listener_actions()
+        self.community.refresh_from_db()
+        self.assertEqual(self.community.last_topic_id, 2)
+        self.assertTrue(self.community.latest_etag)
+
+        # unchanged topic list
+        self.forum.requests.clear()
+        discourse_listener_actions()
+        self.assertEqual(self.forum.requests, ["/latest.json"])
+        self.assertEqual(DiscourseCreateTopic.objects.count(), 1)
+
+        # a new topic is ingested by id, however old its timestamp looks
+        old = datetime.datetime.now() - datetime.timedelta(days=1)
+        self.forum.responses["/latest.json"] = (200, latest_topics((1, old), (2, old), (3, old)))
+        self.forum.responses["/t/3/posts.json?include_raw=True"] = (200, {"post_stream": {"posts": [{"raw": "new"}]}})
+        discourse_listener_actions()
+        self.assertEqual(sorted(DiscourseCreateTopic.objects.values_list("topic_id", flat=True)), [1, 3])
+        self.community.refresh_from_db()
+        self.assertEqual(self.community.last_topic_id, 3)
+
+    def test_failing_community(self):
+        """A community that fails to process doesn't stop the cursors and votes of the others"""
+        from unittest import mock
+
+        from policyengine.models import Proposal
+
+        now = datetime.datetime.now()
+        poll = {"polls": [{"options": [], "preloaded_voters": {}}]}
+        self.forum.responses["/posts/10.json"] = (200, poll)
+        failing_forum = FakeDiscourse(
+            {
+                "/latest.json": (200, latest_topics((1, now))),
+                "/t/1/posts.json?include_raw=True": (200, {"post_stream": {"posts": [{"raw": "hello"}]}}),
+                "/posts/10.json": (200, poll),
+            }
+        )
+        self.addCleanup(failing_forum.close)
+        failing = DiscourseCommunity.objects.create(
+            community_name="failing discourse community", team_id=failing_forum.url, api_key="key3"
+        )
+        policy = Policy.objects.get(community=self.community.community)
+        for community in [failing, self.community]:
+            action = DiscourseCreateTopic(community=community, title="a vote", raw="vote", category=1, topic_id=100)
+            action.save(evaluate_action=False)
+            Proposal.objects.create(action=action, policy=policy, status=Proposal.PROPOSED, vote_post_id="10")
+
+        original_save = DiscourseCreateTopic.save
+
+        def save(action, *args, **kwargs):
+            if action.community.pk == failing.pk:
+                raise RuntimeError("evaluation failed")
+            return original_save(action, *args, **kwargs)
+
+        def update_votes(community, proposal, poll):
+            if community.pk == failing.pk:
+                raise RuntimeError("vote failed")
+
+        with mock.patch.object(DiscourseCreateTopic, "save", autospec=True, side_effect=save), mock.patch.object(
+            DiscourseTasks, "update_votes", side_effect=update_votes
+        ) as update_votes_mock:
+            discourse_listener_actions()
+
+        self.assertEqual(DiscourseCreateTopic.objects.get(topic_id=1).community.pk, self.community.pk)
+        self.community.refresh_from_db()
+        self.assertEqual(self.community.last_topic_id, 2)
+        self.assertTrue(self.community.latest_etag)
+        # the failing community's new topics are tried again on the next poll
+        failing.refresh_from_db()
+        self.assertIsNone(failing.last_topic_id)
+        self.assertFalse(failing.latest_etag)
+        self.assertEqual(update_votes_mock.call_count, 2)
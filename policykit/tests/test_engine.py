@@ -266,6 +266,33 @@ class EvaluationTests(TestCase):
             action, expected_policy=slackpinmessage_policy, expected_did_execute=False, expected_status=Proposal.PASSED
         )
 
+    def test_policy_index(self):
+        """Eligible policies are served from the cached index, which is invalidated when policies change"""
+        from policyengine.engine import get_eligible_policies
+
+        base_policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PASS, kind=Policy.PLATFORM, community=self.community)
+        pin_policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PASS, kind=Policy.PLATFORM, community=self.community)
+        pin_policy.action_types.add(ActionType.objects.create(codename="slackpinmessage"))
+
+        action = self.new_slackpinmessage()
+        self.assertEqual([p.pk for p in get_eligible_policies(action)], [pin_policy.pk, base_policy.pk])
+        # Only the policies themselves are loaded, the index comes from the cache
+        with self.assertNumQueries(1):
+            get_eligible_policies(action)
+
+        # Policies deactivated without the signals (as seen by a process with a stale index) are skipped
+        Policy.objects.filter(pk=pin_policy.pk).update(is_active=False)
+        self.assertEqual([p.pk for p in get_eligible_policies(action)], [base_policy.pk])
+        Policy.objects.filter(pk=pin_policy.pk).update(is_active=True)
+
+        pin_policy.action_types.clear()
+        pin_policy.action_types.add(ActionType.objects.create(codename="slackpostmessage"))
+        self.assertEqual([p.pk for p in get_eligible_policies(action)], [base_policy.pk])
+
+        base_policy.is_active = False
+        base_policy.save()
+        self.assertEqual(get_eligible_policies(action), [])
+
     def test_policy_exception(self):
         """Policies that raise exceptions are skipped"""
         all_pass_policy = Policy.objects.create(
@@ -308,6 +335,33 @@ class EvaluationTests(TestCase):
             expected_status=Proposal.FAILED,
         )
 
+    def test_policy_exception_filters_once(self):
+        """Each policy's Filter step runs at most once per action, even when policies raise"""
+        from unittest import mock
+
+        from policyengine import engine
+
+        all_pass_policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PASS,
+            kind=Policy.PLATFORM,
+            community=self.community,
+        )
+        for i in range(3):
+            Policy.objects.create(
+                **{**TestUtils.ALL_ACTIONS_PASS, "initialize": "raise Exception('thrown from policy')", "name": f"raises {i}"},
+                kind=Policy.PLATFORM,
+                community=self.community,
+            )
+
+        with mock.patch.object(engine, "exec_code_block", wraps=engine.exec_code_block) as exec_code_block:
+            action = self.new_slackpinmessage(community_origin=True)
+            self.evaluate_action_helper(
+                action, expected_policy=all_pass_policy, expected_did_execute=False, expected_status=Proposal.PASSED
+            )
+        filter_calls = [c for c in exec_code_block.call_args_list if c.args[2] == Policy.FILTER]
+        self.assertEqual(len(filter_calls), 4)
+        self.assertEqual(Proposal.objects.filter(action=action).count(), 1)
+
     def test_async_governing_policy_proposed_passed(self):
         """Test governed action: PROPOSED->PASSED is reverted and executed"""
         policy = Policy.objects.create(
@@ -338,6 +392,299 @@ class EvaluationTests(TestCase):
             expected_status=Proposal.PASSED,
         )
 
+    def test_recheck_in(self):
+        """Pending proposals are skipped by the sweep until their next_evaluation_at"""
+        from unittest import mock
+
+        from policyengine import engine
+        from policyengine.tasks import evaluate_pending_proposals
+
+        policy = Policy.objects.create(
+            **{**TestUtils.ALL_ACTIONS_PROPOSED, "check": "proposal.recheck_in(hours=1)\nreturn PROPOSED"},
+            kind=Policy.PLATFORM,
+            community=self.community,
+        )
+        action = self.new_slackpinmessage(community_origin=True)
+        proposal = self.evaluate_action_helper(
+            action,
+            expected_policy=policy,
+            expected_did_execute=False,
+            expected_did_revert=True,
+            expected_status=Proposal.PROPOSED,
+        )
+        proposal.refresh_from_db()
+        self.assertIsNotNone(proposal.next_evaluation_at)
+
+        with mock.patch.object(engine, "evaluate_proposal") as evaluate_proposal:
+            evaluate_pending_proposals()
+            evaluate_proposal.assert_not_called()
+
+            Proposal.objects.filter(pk=proposal.pk).update(next_evaluation_at=None)
+            evaluate_pending_proposals()
+            self.assertEqual(evaluate_proposal.call_count, 1)
+
+    def test_votes_clear_recheck(self):
+        """Every kind of vote write makes the sweep evaluate the proposal again, and evaluations don't undo that"""
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from policyengine.models import BooleanVote
+
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        proposal = self.evaluate_action_helper(
+            self.new_slackpinmessage(), expected_policy=policy, expected_did_execute=False, expected_status=Proposal.PROPOSED
+        )
+
+        def recheck_later():
+            Proposal.objects.filter(pk=proposal.pk).update(next_evaluation_at=timezone.now() + timedelta(hours=1))
+            proposal.refresh_from_db()
+
+        # a vote saved directly, like the Discourse listener does
+        recheck_later()
+        vote = BooleanVote.objects.create(proposal=proposal, user=self.user, boolean_value=True)
+        self.assertIsNone(Proposal.objects.get(pk=proposal.pk).next_evaluation_at)
+        recheck_later()
+        vote.delete()
+        self.assertIsNone(Proposal.objects.get(pk=proposal.pk).next_evaluation_at)
+
+        # votes written in bulk, like the Reddit poller does
+        recheck_later()
+        self.assertTrue(proposal.sync_votes({True: ["user1"], False: []}, self.slack_community, SlackUser))
+        self.assertIsNone(Proposal.objects.get(pk=proposal.pk).next_evaluation_at)
+
+        # an evaluation that started before the vote doesn't restore the old recheck time
+        recheck_later()
+        evaluating = Proposal.objects.get(pk=proposal.pk)
+        self.assertTrue(proposal.sync_votes({True: [], False: ["user1"]}, self.slack_community, SlackUser))
+        evaluating._save_evaluation()
+        self.assertIsNone(Proposal.objects.get(pk=proposal.pk).next_evaluation_at)
+
+    def test_evaluate_proposals_commits_status(self):
+        """A proposal that passed stays passed when a later step raises, so its action isn't executed again"""
+        from unittest import mock
+
+        from integrations.slack.models import SlackPinMessage
+        from policyengine.models import ExecutedActionTriggerAction
+        from policyengine.tasks import evaluate_proposals
+
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        action = self.new_slackpinmessage(community_origin=False)
+        proposal = self.evaluate_action_helper(
+            action, expected_policy=policy, expected_did_execute=False, expected_status=Proposal.PROPOSED
+        )
+        policy.check = "return PASSED"
+        policy.save()
+
+        with mock.patch.object(SlackPinMessage, "execute") as execute, mock.patch.object(
+            ExecutedActionTriggerAction, "from_action", side_effect=RuntimeError("trigger failed")
+        ):
+            with self.assertRaises(RuntimeError):
+                evaluate_proposals([proposal.pk])
+            proposal.refresh_from_db()
+            self.assertEqual(proposal.status, Proposal.PASSED)
+            self.assertIsNone(proposal.claimed_until)
+
+            evaluate_proposals([proposal.pk])
+            self.assertEqual(execute.call_count, 1)
+
+    def test_evaluate_proposals_skips_claimed(self):
+        """Proposals claimed by another worker are skipped until the claim expires"""
+        from datetime import timedelta
+        from unittest import mock
+
+        from django.utils import timezone
+        from policyengine import tasks
+
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        proposal = self.evaluate_action_helper(
+            self.new_slackpinmessage(), expected_policy=policy, expected_did_execute=False, expected_status=Proposal.PROPOSED
+        )
+
+        with mock.patch.object(tasks, "evaluate_pending_proposal") as evaluate_pending_proposal:
+            Proposal.objects.filter(pk=proposal.pk).update(claimed_until=timezone.now() + timedelta(minutes=1))
+            tasks.evaluate_proposals([proposal.pk])
+            evaluate_pending_proposal.assert_not_called()
+
+            Proposal.objects.filter(pk=proposal.pk).update(claimed_until=timezone.now() - timedelta(minutes=1))
+            tasks.evaluate_proposals([proposal.pk])
+            self.assertEqual(evaluate_pending_proposal.call_count, 1)
+
+    def test_schedule_proposal_reevaluation(self):
+        """Votes in quick succession dispatch one reevaluation, once the votes are committed"""
+        from datetime import timedelta
+        from unittest import mock
+
+        from django.conf import settings
+        from django.core.cache import cache
+        from django.utils import timezone
+        from policyengine import tasks
+
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        proposal = self.evaluate_action_helper(
+            self.new_slackpinmessage(), expected_policy=policy, expected_did_execute=False, expected_status=Proposal.PROPOSED
+        )
+        proposal.recheck_in(hours=1)
+        cache.delete(tasks._reevaluation_cache_key(proposal.pk))
+
+        with mock.patch.object(tasks.reevaluate_proposal, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                tasks.schedule_proposal_reevaluation(proposal)
+                tasks.schedule_proposal_reevaluation(proposal)
+                apply_async.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+            apply_async.assert_called_once_with((proposal.pk,), countdown=settings.PROPOSAL_REEVALUATION_DELAY)
+            self.assertIsNone(Proposal.objects.get(pk=proposal.pk).next_evaluation_at)
+
+            # once the evaluation runs, the next vote schedules another one
+            with mock.patch.object(tasks, "evaluate_pending_proposal") as evaluate_pending_proposal:
+                tasks.reevaluate_proposal(proposal.pk)
+            evaluate_pending_proposal.assert_called_once()
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.schedule_proposal_reevaluation(proposal)
+            self.assertEqual(apply_async.call_count, 2)
+
+            # a proposal that another worker is evaluating is tried again later, with a doubling delay
+            apply_async.reset_mock()
+            Proposal.objects.filter(pk=proposal.pk).update(claimed_until=timezone.now() + timedelta(minutes=1))
+            cache.delete(tasks._reevaluation_cache_key(proposal.pk))
+            tasks.reevaluate_proposal(proposal.pk)
+            apply_async.assert_called_once_with((proposal.pk, 1), countdown=settings.PROPOSAL_REEVALUATION_DELAY * 2)
+            tasks.reevaluate_proposal(proposal.pk, 1)
+            apply_async.assert_called_with((proposal.pk, 2), countdown=settings.PROPOSAL_REEVALUATION_DELAY * 4)
+
+            # and left to the periodic sweep after the last retry
+            apply_async.reset_mock()
+            tasks.reevaluate_proposal(proposal.pk, settings.PROPOSAL_REEVALUATION_RETRIES)
+            apply_async.assert_not_called()
+
+    def test_vote_handler_schedules_reevaluation(self):
+        """The Slack vote handler schedules a reevaluation when the votes changed"""
+        from unittest import mock
+
+        import integrations.slack.handlers as SlackHandlers
+
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        proposal = self.evaluate_action_helper(
+            self.new_slackpinmessage(), expected_policy=policy, expected_did_execute=False, expected_status=Proposal.PROPOSED
+        )
+        process = mock.Mock()
+        process.plugin.community_platform_id = self.slack_community.team_id
+        process.plugin.community.slug = self.community.metagov_slug
+        outcome = {"votes": {"yes": {"users": ["user1"]}, "no": {"users": []}}}
+
+        with mock.patch.object(Proposal.objects, "get", return_value=proposal), mock.patch.object(
+            SlackHandlers, "schedule_proposal_reevaluation"
+        ) as schedule:
+            SlackHandlers.slack_vote_updated_receiver(None, process, "pending", outcome, None)
+            schedule.assert_called_once_with(proposal)
+
+            # the same outcome again doesn't change any votes
+            SlackHandlers.slack_vote_updated_receiver(None, process, "pending", outcome, None)
+            schedule.assert_called_once()
+
+    def test_vote_summary(self):
+        """Vote counts are returned from one query, or from the stored tally"""
+        from policyengine.models import BooleanVote, ChoiceVote, NumberVote
+
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        action = self.new_slackpinmessage(community_origin=True)
+        proposal = self.evaluate_action_helper(
+            action,
+            expected_policy=policy,
+            expected_did_execute=False,
+            expected_did_revert=True,
+            expected_status=Proposal.PROPOSED,
+        )
+        users = [self.user] + [SlackUser.objects.create(username=f"voter{i}", community=self.slack_community) for i in range(3)]
+        BooleanVote.objects.create(proposal=proposal, user=users[0], boolean_value=True)
+        BooleanVote.objects.create(proposal=proposal, user=users[1], boolean_value=True)
+        BooleanVote.objects.create(proposal=proposal, user=users[2], boolean_value=False)
+        ChoiceVote.objects.create(proposal=proposal, user=users[0], value="consent")
+        NumberVote.objects.create(proposal=proposal, user=users[3], number_value=5)
+
+        expected = {"yes": 2, "no": 1, "choices": {"consent": 1}, "numbers": {5: 1}}
+        with self.assertNumQueries(1):
+            self.assertEqual(proposal.get_vote_summary(), expected)
+        self.assertEqual(
+            proposal.get_vote_summary(users=users[1:3]), {"yes": 1, "no": 1, "choices": {}, "numbers": {}}
+        )
+
+        self.assertEqual(proposal.refresh_vote_tally(), expected)
+        proposal.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(proposal.get_vote_summary(), expected)
+
+        # changing a vote outside of the vote receivers clears the stored tally
+        BooleanVote.objects.filter(proposal=proposal, user=users[2]).first().delete()
+        proposal.refresh_from_db()
+        self.assertIsNone(proposal.vote_tally)
+        self.assertEqual(proposal.get_vote_summary()["no"], 0)
+
+        # a tally stored while the proposal was being evaluated isn't overwritten when it passes
+        Proposal.objects.get(pk=proposal.pk).refresh_vote_tally()
+        proposal._pass_evaluation()
+        proposal.refresh_from_db()
+        self.assertEqual(proposal.status, Proposal.PASSED)
+        self.assertEqual(proposal.vote_tally["yes"], 2)
+
+    def test_sync_votes(self):
+        """A full vote outcome is applied with bulk queries, creating users and votes as needed"""
+        from policyengine.models import BooleanVote
+
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        action = self.new_slackpinmessage(community_origin=True)
+        proposal = self.evaluate_action_helper(
+            action,
+            expected_policy=policy,
+            expected_did_execute=False,
+            expected_did_revert=True,
+            expected_status=Proposal.PROPOSED,
+        )
+
+        votes = {True: ["user1", "newuser"], False: []}
+        self.assertTrue(proposal.sync_votes(votes, self.slack_community, SlackUser))
+        self.assertEqual(SlackUser.objects.filter(community=self.slack_community, username="newuser").count(), 1)
+        self.assertEqual(proposal.vote_tally["yes"], 2)
+
+        # resending the same outcome changes nothing
+        self.assertFalse(proposal.sync_votes(votes, self.slack_community, SlackUser))
+
+        self.assertTrue(proposal.sync_votes({True: ["user1"], False: ["newuser"]}, self.slack_community, SlackUser))
+        self.assertEqual(BooleanVote.objects.filter(proposal=proposal).count(), 2)
+        proposal.refresh_from_db()
+        summary = proposal.get_vote_summary()
+        self.assertEqual((summary["yes"], summary["no"]), (1, 1))
+
+    def test_policy_step_stats(self):
+        """Each step that runs is timed and counted, and flushed to PolicyStepStats"""
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from policyengine.models import PolicyStepStats
+        from policyengine.profiler import profiler
+
+        profiler.flush()
+        policy = Policy.objects.create(**TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.community)
+        for _ in range(2):
+            action = self.new_slackpinmessage(community_origin=True)
+            self.evaluate_action_helper(
+                action,
+                expected_policy=policy,
+                expected_did_execute=False,
+                expected_did_revert=True,
+                expected_status=Proposal.PROPOSED,
+            )
+        profiler.flush()
+
+        rows = {row["step"]: row for row in PolicyStepStats.summarize(timezone.now() - timedelta(minutes=5))}
+        self.assertEqual(rows["check"]["count"], 2)
+        self.assertEqual(rows["evaluation"]["count"], 2)
+        self.assertGreaterEqual(rows["evaluation"]["total_time"], rows["check"]["total_time"])
+        self.assertGreater(rows["evaluation"]["queries"], 0)
+
+        # statistics only cover the given community
+        self.assertEqual(PolicyStepStats.summarize(timezone.now(), community=self.constitution_community), [])
+
     def test_async_governing_policy_proposed_failed(self):
         """Test governed action: PROPOSED->FAILED is reverted"""
         policy = Policy.objects.create(
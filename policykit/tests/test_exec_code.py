@@ -1,7 +1,8 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from integrations.slack.models import SlackPinMessage
-from policyengine.engine import EvaluationContext, PolicyCodeError, exec_code_block
-from policyengine.models import Policy, Proposal
+from policyengine.engine import EvaluationContext, PolicyCodeError, compiled_code_cache, exec_code_block
+from policyengine.models import DataStore, Policy, Proposal
+from django_db_logger.db_log_handler import flush_database_logs
 from django_db_logger.models import EvaluationLog
 import tests.utils as TestUtils
 from policyengine.safe_exec_code import execute_user_code
@@ -90,6 +91,46 @@ def test(inst):
             execute_user_code(example, "test", MyClass())
         self.assertTrue("Restricted" in str(cm.exception))
 
+    def test_getattr_guard_cache(self):
+        """Attributes that were allowed once for a type don't let denied attributes through"""
+        example = """
+def test(inst, s):
+    total = 0
+    for i in range(3):
+        total += inst.value
+    s.upper()
+    return total
+"""
+        self.assertEqual(execute_user_code(example, "test", MyClass(), "abc"), 30)
+
+        with self.assertRaises(NotImplementedError):
+            execute_user_code("def test(s):\n    return s.format", "test", "abc")
+        with self.assertRaises(SyntaxError):
+            execute_user_code("def test(inst):\n    return inst._private_attr", "test", MyClass())
+
+    def test_getattr_guard_cache_classes(self):
+        """Allowing an attribute on one class doesn't allow it on other classes, which all share the type 'type'"""
+        from unittest import mock
+
+        from policyengine import safe_exec_code
+
+        class Forbidden:
+            value = 20
+
+        original_safer_getattr = safe_exec_code.safer_getattr
+
+        def safer_getattr(object, name, default=None, getattr=getattr):
+            # a check that depends on the object, not only its type
+            if object is Forbidden:
+                raise AttributeError("Forbidden")
+            return original_safer_getattr(object, name, default, getattr)
+
+        with mock.patch.object(safe_exec_code, "safer_getattr", side_effect=safer_getattr):
+            self.assertEqual(execute_user_code("def test(cls):\n    return cls.value", "test", MyClass), 10)
+            with self.assertRaises(AttributeError):
+                execute_user_code("def test(cls):\n    return cls.value", "test", Forbidden)
+        self.assertNotIn((type, "value"), safe_exec_code._getattr_allowed)
+
 
 class ExecPolicyCodeTests(TestCase):
     """
@@ -153,6 +194,105 @@ class ExecPolicyCodeTests(TestCase):
 
         ctx = EvaluationContext(self.proposal)
         exec_code_block("logger.debug('hello')", ctx)
-        self.assertEqual(EvaluationLog.objects.filter(proposal=self.proposal, msg__contains="hello").count(), 1)
         exec_code_block("logger.error('world')", ctx)
+        # logs are buffered until the end of the evaluation
+        self.assertEqual(EvaluationLog.objects.filter(proposal=self.proposal).count(), 0)
+        flush_database_logs()
+        self.assertEqual(EvaluationLog.objects.filter(proposal=self.proposal, msg__contains="hello").count(), 1)
         self.assertEqual(EvaluationLog.objects.filter(proposal=self.proposal, msg__contains="world").count(), 1)
+
+    def test_compiled_code_cache(self):
+        """Test that compiled steps are reused, and dropped when the policy is saved"""
+        compiled_code_cache.clear()
+        ctx = EvaluationContext(self.proposal)
+
+        self.assertEqual(exec_code_block("return PASSED", ctx, "check"), "passed")
+        self.assertEqual(len(compiled_code_cache), 1)
+        self.assertEqual(exec_code_block("return PASSED", ctx, "check"), "passed")
+        self.assertEqual(len(compiled_code_cache), 1)
+
+        # different code for the same step gets its own entry
+        self.assertEqual(exec_code_block("return FAILED", ctx, "check"), "failed")
+        self.assertEqual(len(compiled_code_cache), 2)
+
+        # code that doesn't compile is never cached
+        self.assertRaises(PolicyCodeError, exec_code_block, "import os", ctx, "check")
+        self.assertEqual(len(compiled_code_cache), 2)
+
+        self.policy.save()
+        self.assertEqual(len(compiled_code_cache), 0)
+
+    def test_lazy_context(self):
+        """Test that only the parts of the EvaluationContext used by the code are built"""
+        ctx = EvaluationContext(self.proposal)
+        exec_code_block("return action.id", ctx)
+        self.assertNotIn("variables", ctx.__dict__)
+        self.assertNotIn("metagov", ctx.__dict__)
+        self.assertEqual(ctx._platforms, {})
+
+        self.assertEqual(exec_code_block("return slack.team_id", ctx), "ABC")
+        self.assertEqual(ctx.slack.team_id, "ABC")
+        self.assertEqual(exec_code_block("return len(variables)", ctx), 0)
+        self.assertIn("variables", ctx.__dict__)
+
+        # names that aren't platforms of the community are remembered too, for later evaluations
+        from unittest import mock
+
+        from policyengine import engine
+
+        exec_code_block("discord = 1\nreturn discord", EvaluationContext(self.proposal))
+        with self.assertNumQueries(0), mock.patch.object(engine.Utils, "get_platform_integrations") as integrations:
+            exec_code_block("discord = 1\nreturn discord", EvaluationContext(self.proposal))
+        integrations.assert_not_called()
+
+    def test_data_store_batch_writes(self):
+        """Test that proposal.data changes are saved once, at the end of the batch"""
+        ctx = EvaluationContext(self.proposal)
+        data = self.proposal.data
+        with DataStore.batch_writes():
+            exec_code_block("proposal.data.set('count', 1)\nproposal.data.set('names', ['a', 'b'])", ctx)
+            self.assertEqual(data.get("count"), 1)
+            self.assertEqual(DataStore.objects.get(pk=data.pk).data_store, {})
+        self.assertEqual(DataStore.objects.get(pk=data.pk).data_store, {"count": 1, "names": ["a", "b"]})
+
+        # outside a batch, changes are saved immediately
+        self.assertTrue(data.remove("count"))
+        self.assertEqual(DataStore.objects.get(pk=data.pk).data_store, {"names": ["a", "b"]})
+        self.assertRaises(TypeError, data.set, "bad", object())
+
+        # changing a value that was read doesn't change the store
+        data.get("names").append("c")
+        data.set("count", 2)
+        self.assertEqual(DataStore.objects.get(pk=data.pk).data_store, {"count": 2, "names": ["a", "b"]})
+
+    def test_step_budget(self):
+        """Steps that run too long or return too much are stopped, and counted on the policy"""
+        ctx = EvaluationContext(self.proposal)
+
+        with override_settings(POLICY_STEP_MAX_STEPS=1000):
+            with self.assertRaises(PolicyCodeError) as cm:
+                exec_code_block("while True:\n  pass", ctx, "check")
+            self.assertTrue("Exceeded the limit of 1000 steps" in str(cm.exception))
+
+            # catching the exception in the policy doesn't get around the budget
+            with self.assertRaises(PolicyCodeError):
+                exec_code_block("try:\n  while True:\n    pass\nexcept Exception:\n  return PASSED", ctx, "check")
+            # not even in a loop that keeps catching it, after Python has removed the trace function
+            with self.assertRaises(PolicyCodeError):
+                exec_code_block("while True:\n  try:\n    pass\n  except Exception:\n    pass", ctx, "check")
+            with self.assertRaises(PolicyCodeError):
+                exec_code_block("while True:\n  try:\n    pass\n  finally:\n    continue", ctx, "check")
+
+            self.assertEqual(exec_code_block("for i in range(10):\n  pass\nreturn PASSED", ctx, "check"), "passed")
+
+        with override_settings(POLICY_STEP_TIMEOUT=0.05):
+            with self.assertRaises(PolicyCodeError) as cm:
+                exec_code_block("while True:\n  pass", ctx, "check")
+            self.assertTrue("time limit" in str(cm.exception))
+
+        with override_settings(POLICY_STEP_MAX_RESULT_SIZE=100):
+            self.assertRaises(PolicyCodeError, exec_code_block, "return 'x' * 200", ctx, "check")
+
+        self.policy.refresh_from_db()
+        self.assertEqual(self.policy.budget_exceeded_count, 6)
+        self.assertIsNotNone(self.policy.budget_exceeded_at)
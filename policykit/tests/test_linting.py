@@ -36,3 +36,67 @@ class LinterTests(TestCase):
             code = f"x = {variable}"
             errors = _lint_check(code, "check")
             self.assertEqual(len(errors), 0)
+
+    def test_restricted_code(self):
+        code = "x = 1\nimport os"
+        errors = _lint_check(code)
+        self.assertEqual(errors, ["2:0: E0010: Import statements are not allowed. (restricted-code)"])
+
+        errors = _lint_check("_secret = action._state")
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all(error.startswith("1:0: E0010: ") for error in errors))
+
+    def test_undefined_variable_position(self):
+        code = "for vote in votes:\n    total = vote\nreturn total + missing"
+        self.assertEqual(
+            _lint_check(code, "check"),
+            [
+                "1:12: E0602: Undefined variable 'votes' (undefined-variable)",
+                "3:15: E0602: Undefined variable 'missing' (undefined-variable)",
+            ],
+        )
+
+    def test_compile_errors(self):
+        self.assertEqual(_lint_check(""), [])
+        errors = _lint_check("x = 1\nbreak")
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("2:"))
+        self.assertIn("E0001: 'break' outside loop", errors[0])
+
+    def test_cached(self):
+        from unittest import mock
+
+        from policyengine import linter
+
+        code = "x = 'cached'"
+        self.assertEqual(_lint_check(code), [])
+        with mock.patch.object(linter, "_check") as check:
+            self.assertEqual(_lint_check(code), [])
+        check.assert_not_called()
+
+    def test_deep_check(self):
+        """Pylint runs in a celery task, and any process reads its errors from the result backend"""
+        from unittest import mock
+
+        from django.core.cache import cache
+        from policyengine import linter
+        from policyengine.tasks import deep_lint_check
+
+        def run_in_worker(args, task_id):
+            # Tasks run eagerly in tests, and celery doesn't store eager results, so store it like a worker would
+            result = deep_lint_check.apply(args, task_id=task_id)
+            if not deep_lint_check.ignore_result:
+                deep_lint_check.backend.store_result(task_id, result.result, result.state)
+            return deep_lint_check.AsyncResult(task_id)
+
+        code = "x = 'deep'.no_such_method()"
+        with mock.patch.object(deep_lint_check, "apply_async", side_effect=run_in_worker) as apply_async:
+            errors = linter.get_deep_lint_errors(code)
+            self.assertEqual(len(errors), 1)
+            self.assertIn("E1101", errors[0])
+            self.assertEqual(linter.get_deep_lint_errors(code), errors)
+
+            # a process that hasn't cached the errors finds them in the result backend, without running pylint again
+            cache.clear()
+            self.assertEqual(linter.get_deep_lint_errors(code), errors)
+        apply_async.assert_called_once()
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from policyengine.models import Policy, PolicyStepStats
+from policyengine.profiler import profiler
+
+import tests.utils as TestUtils
+
+
+class PolicyStatsTests(TestCase):
+    """
+    Test the policystats view and the policy_stats management command
+    """
+
+    def setUp(self):
+        # Write out statistics left in memory by other tests, so they don't mix with the seeded rows
+        profiler.flush()
+        self.slack_community, self.user = TestUtils.create_slack_community_and_user()
+        self.community = self.slack_community.community
+        self.client.force_login(user=self.user, backend="integrations.slack.auth_backends.SlackBackend")
+
+        self.cheap_policy = Policy.objects.create(
+            **{**TestUtils.ALL_ACTIONS_PASS, "name": "cheap policy"}, kind=Policy.PLATFORM, community=self.community
+        )
+        self.slow_policy = Policy.objects.create(
+            **{**TestUtils.ALL_ACTIONS_PASS, "name": "slow policy"}, kind=Policy.PLATFORM, community=self.community
+        )
+        other_slack_community, _ = TestUtils.create_slack_community_and_user(team_id="DEF", username="user2")
+        other_policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PASS, kind=Policy.PLATFORM, community=other_slack_community.community
+        )
+
+        now = timezone.now().replace(second=0, microsecond=0)
+        for policy, step, minutes_ago, count, total_time, max_time, queries, max_queries, calls in [
+            (self.cheap_policy, "check", 2, 2, 0.3, 0.2, 4, 2, 1),
+            (self.cheap_policy, "check", 1, 1, 0.1, 0.1, 2, 2, 0),
+            # older than the default hour
+            (self.cheap_policy, "check", 120, 5, 0.5, 0.1, 5, 1, 0),
+            (self.slow_policy, "filter", 1, 10, 1.0, 0.5, 10, 1, 3),
+            # another community
+            (other_policy, "check", 1, 1, 9.0, 9.0, 1, 1, 0),
+        ]:
+            PolicyStepStats.objects.create(
+                policy=policy, step=step, bucket=now - timedelta(minutes=minutes_ago), count=count,
+                total_time=total_time, max_time=max_time, total_queries=queries, max_queries=max_queries,
+                total_platform_calls=calls,
+            )
+
+    def test_view(self):
+        """The view totals each step of the community's policies, most expensive first"""
+        response = self.client.get("/main/policystats/")
+        self.assertEqual(response.status_code, 200)
+        stats = response.context["stats"]
+        self.assertEqual(
+            [(row["policy_id"], row["step"]) for row in stats],
+            [(self.slow_policy.pk, "filter"), (self.cheap_policy.pk, "check")],
+        )
+        check = stats[1]
+        self.assertEqual(
+            (check["count"], check["queries"], check["max_queries"], check["platform_calls"]), (3, 6, 2, 1)
+        )
+        self.assertAlmostEqual(check["total_time"], 0.4)
+        self.assertAlmostEqual(check["avg_time"], 0.4 / 3)
+        self.assertAlmostEqual(check["max_time"], 0.2)
+
+        response = self.client.get("/main/policystats/", {"minutes": 180})
+        self.assertEqual(response.context["minutes"], 180)
+        check = [row for row in response.context["stats"] if row["step"] == "check"][0]
+        self.assertEqual(check["count"], 8)
+
+        self.assertEqual(self.client.get("/main/policystats/", {"minutes": "an hour"}).status_code, 400)
+
+    def test_command(self):
+        """The command prints the most expensive steps first, up to the limit"""
+        out = StringIO()
+        call_command("policy_stats", community=self.community.pk, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith("policy"))
+        self.assertTrue(lines[1].startswith(f"slow policy ({self.slow_policy.pk})"))
+        self.assertEqual(lines[1].split()[-7:], ["10", "1.000", "100.0", "500.0", "10", "1", "3"])
+        self.assertTrue(lines[2].startswith(f"cheap policy ({self.cheap_policy.pk})"))
+
+        out = StringIO()
+        call_command("policy_stats", community=self.community.pk, limit=1, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+        # all communities
+        out = StringIO()
+        call_command("policy_stats", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+        out = StringIO()
+        PolicyStepStats.objects.all().delete()
+        call_command("policy_stats", stdout=out)
+        self.assertIn("No policy steps ran in the last 60 minutes.", out.getvalue())
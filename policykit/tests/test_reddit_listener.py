@@ -0,0 +1,121 @@
+from unittest import mock
+
+import requests
+from django.test import TestCase
+from integrations.reddit.models import RedditCommunity, RedditMakePost, RedditUser
+import integrations.reddit.tasks as RedditTasks
+from policyengine.models import BooleanVote, Policy, Proposal
+
+import tests.utils as TestUtils
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def json(self):
+        return self.body
+
+
+class FakeReddit:
+    """Stands in for the requests Session, answering like the Reddit API for a fixed set of paths"""
+
+    def __init__(self, responses, access_token):
+        self.responses = responses
+        self.access_token = access_token
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        path = url[len(RedditCommunity.API):]
+        self.requests.append(path)
+        if headers["Authorization"] != f"bearer {self.access_token}":
+            return FakeResponse(401, {"message": "Unauthorized"})
+        return FakeResponse(*self.responses.get(path, (404, {})))
+
+
+def comment_tree(*comments):
+    return [{}, {"data": {"children": [{"data": {"author": author, "body": body}} for author, body in comments]}}]
+
+
+class RedditListenerTests(TestCase):
+    def setUp(self):
+        self.reddit_community = RedditCommunity.objects.create(
+            community_name="reddit test community", team_id="policykit", access_token="old-token", refresh_token="refresh"
+        )
+        self.alice = RedditUser.objects.create(username="alice", community=self.reddit_community)
+        policy = Policy.objects.create(
+            **TestUtils.ALL_ACTIONS_PROPOSED, kind=Policy.PLATFORM, community=self.reddit_community.community
+        )
+        action = RedditMakePost(community=self.reddit_community, initiator=self.alice, title="a post", text="hi")
+        action.save(evaluate_action=False)
+        self.proposal = Proposal.objects.create(
+            action=action, policy=policy, status=Proposal.PROPOSED, vote_post_id="t3_vote"
+        )
+        self.reddit = FakeReddit(
+            {
+                "api/info?id=t3_vote": (200, {"data": {"children": [{"data": {"name": "t3_vote", "num_comments": 2}}]}}),
+                # bob isn't known to PolicyKit, so his vote isn't counted
+                "r/policykit/comments/vote.json": (200, comment_tree(("alice", "\\+1"), ("bob", "\\-1"))),
+            },
+            access_token="new-token",
+        )
+
+    def update_votes(self):
+        with mock.patch.object(RedditTasks, "get_http_session", return_value=self.reddit), mock.patch(
+            "integrations.reddit.models.refresh_access_token", return_value={"access_token": "new-token"}
+        ) as refresh_access_token, mock.patch.object(RedditTasks, "schedule_proposal_reevaluation") as schedule:
+            RedditTasks.update_votes(self.reddit_community)
+        return refresh_access_token, schedule
+
+    def test_get_json_token_expired(self):
+        """A rejected token raises RedditTokenExpired, and is refreshed once before giving up"""
+        with mock.patch.object(RedditTasks, "get_http_session", return_value=self.reddit):
+            with self.assertRaises(RedditTasks.RedditTokenExpired):
+                RedditTasks.get_json(self.reddit_community, "api/info?id=t3_vote")
+
+            with mock.patch(
+                "integrations.reddit.models.refresh_access_token", return_value={"access_token": "still-wrong"}
+            ) as refresh_access_token:
+                self.assertIsNone(RedditTasks.get_json_refreshing_token(self.reddit_community, "api/info?id=t3_vote"))
+        refresh_access_token.assert_called_once_with("refresh")
+        self.assertEqual(self.reddit.requests, ["api/info?id=t3_vote"] * 3)
+
+    def test_update_votes(self):
+        """An expired token is refreshed and the request retried, then changed votes are synced and re-evaluated"""
+        refresh_access_token, schedule = self.update_votes()
+
+        refresh_access_token.assert_called_once_with("refresh")
+        self.reddit_community.refresh_from_db()
+        self.assertEqual(self.reddit_community.access_token, "new-token")
+        self.assertEqual(
+            self.reddit.requests, ["api/info?id=t3_vote", "api/info?id=t3_vote", "r/policykit/comments/vote.json"]
+        )
+        self.assertEqual(
+            list(BooleanVote.objects.filter(proposal=self.proposal).values_list("user__username", "boolean_value")),
+            [("alice", True)],
+        )
+        schedule.assert_called_once()
+        self.assertEqual(schedule.call_args[0][0].pk, self.proposal.pk)
+        self.assertEqual(self.reddit_community.vote_post_comment_counts, {"t3_vote": 2})
+
+        # Without new comments, the comments aren't fetched and nothing is re-evaluated
+        self.reddit.requests = []
+        refresh_access_token, schedule = self.update_votes()
+        refresh_access_token.assert_not_called()
+        self.assertEqual(self.reddit.requests, ["api/info?id=t3_vote"])
+        schedule.assert_not_called()
+
+        # A changed vote is re-evaluated again
+        self.reddit.responses["api/info?id=t3_vote"][1]["data"]["children"][0]["data"]["num_comments"] = 3
+        self.reddit.responses["r/policykit/comments/vote.json"] = (
+            200,
+            comment_tree(("alice", "\\+1"), ("bob", "\\-1"), ("alice", "\\-1")),
+        )
+        _, schedule = self.update_votes()
+        self.assertFalse(BooleanVote.objects.get(proposal=self.proposal, user=self.alice).boolean_value)
+        schedule.assert_called_once()
@@ -15,6 +15,28 @@ class UtilTests(TestCase):
         self.assertTrue(PolicykitAddCommunityDoc in Utils.get_action_classes("constitution"))
         self.assertTrue(ExpenseApproved in Utils.get_trigger_classes("opencollective"))
 
+    def test_action_registry(self):
+        from unittest import mock
+
+        from django.apps import apps
+        from policyengine.models import WebhookTriggerAction
+
+        with mock.patch.object(apps, "get_app_configs") as get_app_configs:
+            self.assertEqual(Utils.find_action_cls("slackpostmessage", "slack"), SlackPostMessage)
+            self.assertIsNone(Utils.find_action_cls("slackpostmessage", "discord"))
+            self.assertIsNone(Utils.find_action_cls("notanaction"))
+            # policyengine's own actions are only found when asking for the app
+            self.assertIsNone(Utils.find_action_cls("webhooktriggeraction"))
+            self.assertEqual(Utils.find_action_cls("webhooktriggeraction", "policyengine"), WebhookTriggerAction)
+            self.assertFalse(SlackPostMessage in Utils.get_trigger_classes("slack"))
+            self.assertEqual(
+                Utils.get_filter_parameters("slack", "slackpostmessage"), SlackPostMessage.FILTER_PARAMETERS
+            )
+        get_app_configs.assert_not_called()
+
+        with self.assertRaises(LookupError):
+            Utils.get_action_classes("notanapp")
+
     def test_autocomplete(self):
         self.assertTrue("action.channel" in PkAutocomplete.generate_action_autocompletes(SlackPostMessage))
 
@@ -23,6 +45,97 @@ class UtilTests(TestCase):
         # test that "proposal" is not included in vote params, because of shim
         self.assertFalse("proposal" in vote_autocomplete)
 
+    def test_autocomplete_cache(self):
+        """Autocompletes are cached per community and action types, until the community's platforms change"""
+        from integrations.discord.models import DiscordCommunity
+
+        slack_community, _ = TestUtils.create_slack_community_and_user()
+        community = slack_community.community
+
+        autocompletes, etag = Utils.get_autocompletes_and_etag(community, ["slackpostmessage"])
+        self.assertIn("action.channel", autocompletes)
+        self.assertIn("slack", autocompletes)
+        self.assertEqual(autocompletes, sorted(set(autocompletes)))
+        with self.assertNumQueries(0):
+            self.assertEqual(Utils.get_autocompletes_and_etag(community, ["slackpostmessage"]), (autocompletes, etag))
+        self.assertNotIn("action.channel", Utils.get_autocompletes(community))
+
+        DiscordCommunity.objects.create(community_name="discord test community", community=community, team_id="123")
+        new_autocompletes, new_etag = Utils.get_autocompletes_and_etag(community, ["slackpostmessage"])
+        self.assertIn("discord", new_autocompletes)
+        self.assertNotEqual(new_etag, etag)
+
+    def test_autocomplete_view_etag(self):
+        """The editor's copy of the autocompletes is revalidated with its ETag"""
+        from integrations.discord.models import DiscordCommunity
+
+        slack_community, user = TestUtils.create_slack_community_and_user()
+        self.client.force_login(user=user, backend="integrations.slack.auth_backends.SlackBackend")
+        url = "/main/policyengine/get_autocompletes"
+
+        response = self.client.get(url, {"action_types": "slackpostmessage"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("action.channel", response.json()["autocompletes"])
+        etag = response["ETag"]
+        self.assertTrue(etag)
+
+        response = self.client.get(url, {"action_types": "slackpostmessage"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # a different selection of action types
+        response = self.client.get(url, {"action_types": "slackrenameconversation"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        # a platform connected to the community
+        DiscordCommunity.objects.create(
+            community_name="discord test community", community=slack_community.community, team_id="123"
+        )
+        response = self.client.get(url, {"action_types": "slackpostmessage"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("discord", response.json()["autocompletes"])
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_dashboard_summary(self):
+        """The dashboard summary is cached per community, until its roles, policies or activity change"""
+        from actstream import action as actstream_action
+        from policyengine.dashboard import get_dashboard_summary
+        from policyengine.models import ActivityCommunity, CommunityRole, Policy
+
+        slack_community, user = TestUtils.create_slack_community_and_user()
+        community = slack_community.community
+        role = CommunityRole.objects.create(role_name="moderator", community=community)
+        user.groups.add(role)
+        policy = Policy.objects.create(kind=Policy.PLATFORM, community=community, name="all actions pass")
+
+        summary = get_dashboard_summary(community)
+        self.assertIn("moderator", summary["users"][0]["roles"])
+        self.assertIn({"role_name": "moderator", "users": "user1"}, summary["roles"])
+        self.assertEqual([p["pk"] for p in summary["platform_policies"]], [policy.pk])
+        self.assertIsNone(summary["platform_policies"][0]["action_types"])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_summary(community), summary)
+
+        # Activity is indexed by community, and shows up in the summary right away
+        actstream_action.send(user, verb="did a thing", community_id=slack_community.pk)
+        self.assertEqual(ActivityCommunity.objects.filter(community=community).count(), 1)
+        summary = get_dashboard_summary(community)
+        self.assertEqual([a["verb"] for a in summary["action_log"]], ["did a thing"])
+
+        CommunityRole.objects.create(role_name="newcomer", community=community)
+        self.assertEqual(len(get_dashboard_summary(community)["roles"]), len(summary["roles"]) + 1)
+
+        # Pending proposals show their action as its own class, not as a BaseAction
+        from integrations.slack.models import SlackPinMessage
+        from policyengine.models import Proposal
+
+        action = SlackPinMessage(initiator=user, community=slack_community, community_origin=True)
+        action.save()
+        Proposal.objects.create(action=action, policy=policy, status=Proposal.PROPOSED)
+        pending = get_dashboard_summary(community)["pending_proposals"]
+        self.assertEqual([p["action"] for p in pending], [f"Slack Pin Message ({action.pk})"])
+
     def test_action_type_util(self):
         slack_community, user = TestUtils.create_slack_community_and_user()
         community = slack_community.community
@@ -34,4 +147,27 @@ class UtilTests(TestCase):
         self.assertIsNotNone(actions["slack"])
 
         actions = Utils.get_action_types(community, [PolicyActionKind.TRIGGER])
-        self.assertIsNotNone(actions["any platform"])
\ No newline at end of file
+        self.assertIsNotNone(actions["any platform"])
+
+    def test_is_recent_call(self):
+        """PolicyKit's own API calls are found by payload value, from the cache or the database"""
+        from datetime import datetime, timedelta, timezone
+
+        from django.core.cache import cache
+        from policyengine.models import LogAPICall
+
+        slack_community, user = TestUtils.create_slack_community_and_user()
+        LogAPICall.log_call(slack_community, {"method_name": "chat.postMessage", "text": "hello"}, "chat.postMessage")
+
+        self.assertTrue(LogAPICall.is_recent_call(slack_community, "chat.postMessage", "text", "hello", seconds=2))
+        self.assertFalse(LogAPICall.is_recent_call(slack_community, "chat.postMessage", "text", "goodbye", seconds=2))
+        self.assertFalse(LogAPICall.is_recent_call(slack_community, "pins.add", "text", "hello", seconds=2))
+
+        # falls back to the database when the key isn't cached
+        cache.clear()
+        self.assertTrue(LogAPICall.is_recent_call(slack_community, "chat.postMessage", "text", "hello", seconds=2))
+
+        # and when this cache only has an older call, like when another process made the recent one
+        match_key = LogAPICall._match_key(slack_community.pk, "chat.postMessage", "text", "hello")
+        cache.set(match_key, datetime.now(timezone.utc) - timedelta(hours=1))
+        self.assertTrue(LogAPICall.is_recent_call(slack_community, "chat.postMessage", "text", "hello", seconds=2))